@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+"""
+Compares how long it takes to hand a turn to a player and get its answer when
+the player's process is suspended between turns and when it is a cooperative
+player left running.  The player answers every turn straight away, so the
+times are the engine's own overhead.
+
+    python benchmarks/handoff.py [turns] [players]
+"""
+import asyncio
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+my_dir = os.path.realpath(os.path.dirname(__file__))
+sys.path.insert(0, os.path.join(my_dir, os.pardir))
+
+from warcode.engine import Player
+
+ECHO_PLAYER = """
+import sys
+sys.stdin.readline()
+print("Echo", flush=True)
+for line in sys.stdin:
+    print("[]", flush=True)
+"""
+
+# Roughly the size of an early turn's observation
+OBSERVATION = '{"time": 1.0, "gold": 300, "wood": 100, "units": {%s}}' % ", ".join(
+    '"{0}": {{"x": {0}, "y": {0}, "team": 1}}'.format(i) for i in range(50))
+
+
+async def time_turns(player_file, cooperative, turns, players):
+    """
+    Plays turns with each of players copies of the player, returning the
+    seconds each turn took
+    """
+    copies = [Player(player_file, cooperative=cooperative)
+        for i in range(players)]
+    for player in copies:
+        await player.start()
+        await player.first_turn("{}")
+    times = []
+    for turn in range(turns):
+        for player in copies:
+            start = time.perf_counter()
+            await player.turn(OBSERVATION)
+            times.append(time.perf_counter() - start)
+    for player in copies:
+        await player.clean_up(0)
+    return times
+
+
+def main():
+    turns = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    players = int(sys.argv[2]) if len(sys.argv) > 2 else 2
+    with tempfile.TemporaryDirectory() as directory:
+        player_file = os.path.join(directory, "echo.py")
+        with open(player_file, "w") as f:
+            f.write(ECHO_PLAYER)
+        for name, cooperative in [("suspended", False), ("cooperative", True)]:
+            loop = asyncio.new_event_loop()
+            times = loop.run_until_complete(
+                time_turns(player_file, cooperative, turns, players))
+            loop.close()
+            times.sort()
+            print("{:<12} mean {:7.1f} us  median {:7.1f} us  p99 {:7.1f} us"
+                .format(name, statistics.mean(times) * 1e6,
+                    statistics.median(times) * 1e6,
+                    times[int(len(times) * 0.99)] * 1e6))
+
+
+if __name__ == "__main__":
+    main()
@@ -8,5 +8,8 @@ setup(
     author="Joseph Camacho",
     author_email="camacho.joseph@gmail.com",
     packages=find_packages(),
-    include_package_data=True
+    include_package_data=True,
+    extras_require={
+        "numpy": ["numpy"]
+    }
 )
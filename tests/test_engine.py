@@ -0,0 +1,183 @@
+#!/usr/bin/env python3
+import json
+import os
+import unittest
+from unittest import mock
+
+from warcode import constants, exceptions
+from warcode.engine import Engine, PlayerPool
+from warcode.engine.engine import my_dir
+
+root = os.path.realpath(os.path.join(my_dir, os.pardir, os.pardir))
+
+
+class TestEngine(unittest.TestCase):
+    def setUp(self):
+        self.save_file = os.path.join(my_dir, os.pardir, "saves",
+            "test_engine.wcr")
+        # Let the players' processes import the starter kit
+        paths = [path for path in os.environ.get("PYTHONPATH", "").split(
+            os.pathsep) if path]
+        patcher = mock.patch.dict(os.environ,
+            {"PYTHONPATH": os.pathsep.join([root] + paths)})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def tearDown(self):
+        if os.path.exists(self.save_file):
+            os.remove(self.save_file)
+
+    def test_play(self):
+        engine = Engine("Test", ["exampleplayer.py", "exampleplayer.py"],
+            "test_engine", quiet=True, seed=1)
+        engine.play()
+        self.assertEqual(engine.get_winner(), "ExamplePlayer")
+        with open(self.save_file) as f:
+            game_data = json.load(f)
+        self.assertEqual(len(game_data["turns"]), engine.turn - 1)
+        for player in game_data["players"]:
+            self.assertEqual(player["protocol_errors"], 0)
+            self.assertEqual(player["action_errors"], {})
+
+    def test_pool_settings(self):
+        pool = PlayerPool()
+        self.addCleanup(pool.close)
+        for settings in ({"in_process": True}, {"cooperative": True},
+                {"spawner": object()}):
+            with self.assertRaises(ValueError):
+                Engine("Test", ["exampleplayer.py", "exampleplayer.py"],
+                    "test_engine", pool=pool, **settings)
+
+
+def snapshot(engine):
+    """
+    Returns what a game's state looks like to its players
+    """
+    return {
+        "board": [list(row) for row in engine.get_game_map().get_board()],
+        "units": {
+            id: (unit.get_x(), unit.get_y(), unit.get_health(),
+                unit.get_gold(), unit.get_wood(), unit.get_action_taken())
+            for id, unit in engine.get_units().items()
+        },
+        "trees": {id: tree.to_dict() for id, tree in engine.get_trees().items()},
+        "teams": {
+            id: (team.get_gold(), team.get_wood(), sorted(team.get_units()))
+            for id, team in engine.get_teams().items()
+        },
+        "fogs": {
+            id: ([list(row) for row in engine.get_fog_of_war(team).get_board()],
+                sorted(engine.get_fog_of_war(team).get_visible_things()))
+            for id, team in engine.get_teams().items()
+        },
+        "random": engine.random.getstate()
+    }
+
+
+class TestClone(unittest.TestCase):
+    def setUp(self):
+        self.engine = Engine("Test", ["exampleplayer.py", "exampleplayer.py"],
+            "test", quiet=True, seed=1, in_process=True)
+        self.engine.game_data["turns"].append([])
+
+    def tearDown(self):
+        self.engine.loop.close()
+        self.engine.log.close()
+
+    def actions(self, engine, team_id):
+        """
+        Returns a move for each of a team's peasants and a build for its castle
+        """
+        actions = []
+        team = engine.get_teams()[team_id]
+        engine.get_entity_store().reset_actions(team)
+        for unit in team.get_units().values():
+            kinds = (constants.MOVE if unit.get_unit_type() == constants.PEASANT
+                else constants.BUILD)
+            for action in engine.legal_actions(unit):
+                if action["type"] == kinds:
+                    actions.append(action)
+                    break
+        return actions
+
+    def check_isolated(self, changed, other):
+        before = snapshot(other)
+        actions = self.actions(changed, 1)
+        self.assertEqual(len(actions), 6)
+        changed.apply(actions, 1)
+        self.assertEqual(changed.get_action_errors(), [])
+        self.assertNotEqual(snapshot(changed), before)
+        self.assertEqual(snapshot(other), before)
+
+    def test_clone_matches(self):
+        self.assertEqual(snapshot(self.engine.clone()), snapshot(self.engine))
+
+    def test_apply_to_clone(self):
+        self.check_isolated(self.engine.clone(), self.engine)
+
+    def test_apply_to_original(self):
+        self.check_isolated(self.engine, self.engine.clone())
+
+
+class TestCheckAction(unittest.TestCase):
+    def setUp(self):
+        self.engine = Engine("Test", ["exampleplayer.py", "exampleplayer.py"],
+            "test", quiet=True, seed=1, in_process=True)
+        self.engine.game_data["turns"].append([])
+        self.team = self.engine.get_teams()[1]
+        self.unit = next(iter(self.team.get_units().values())).get_id()
+        other_team = self.engine.get_teams()[2]
+        self.other = next(iter(other_team.get_units().values())).get_id()
+
+    def tearDown(self):
+        self.engine.loop.close()
+        self.engine.log.close()
+
+    def check(self, action):
+        return self.engine.check_action(action, self.team)
+
+    def test_accepted(self):
+        for action in (
+                {"type": constants.MOVE, "unit": self.unit, "x": 1, "y": 2},
+                {"type": constants.BUILD, "unit": self.unit,
+                    "unit_type": "PEASANT", "x": 1, "y": 2},
+                {"type": constants.GIVE, "unit": self.unit,
+                    "other": self.other, "gold": 0, "wood": 0},
+                {"type": constants.LOG, "message": ["anything"]}):
+            self.assertIsNone(self.check(action), action)
+
+    def test_rejection_codes(self):
+        move = {"type": constants.MOVE, "unit": self.unit, "x": 1, "y": 2}
+        for action, code in (
+                ([move], exceptions.MALFORMED),
+                ({"unit": self.unit, "x": 1, "y": 2}, exceptions.MALFORMED),
+                (dict(move, type=3), exceptions.MALFORMED),
+                ({"type": constants.MOVE, "unit": self.unit, "x": 1},
+                    exceptions.MALFORMED),
+                (dict(move, x=1.0), exceptions.MALFORMED),
+                (dict(move, x=True), exceptions.MALFORMED),
+                (dict(move, type="DANCE"), exceptions.UNKNOWN_ACTION),
+                (dict(move, unit=-1), exceptions.UNKNOWN_UNIT),
+                (dict(move, unit=self.other), exceptions.NOT_YOUR_UNIT),
+                ({"type": constants.BUILD, "unit": self.unit,
+                    "unit_type": "DRAGON", "x": 1, "y": 2},
+                    exceptions.UNKNOWN_UNIT_TYPE),
+                ({"type": constants.GIVE, "unit": self.unit,
+                    "other": self.other, "gold": -1, "wood": 0},
+                    exceptions.NEGATIVE_AMOUNT),
+                ({"type": constants.GIVE, "unit": self.unit,
+                    "other": self.other, "gold": 0, "wood": -1},
+                    exceptions.NEGATIVE_AMOUNT)):
+            self.assertEqual(self.check(action), code, action)
+
+    def test_rejections_recorded(self):
+        self.engine.process_actions([{"type": "DANCE"},
+            {"type": constants.MOVE, "unit": self.other, "x": 1, "y": 2}],
+            self.team)
+        self.assertEqual(self.engine.get_action_errors(), [
+            (1, self.engine.turn, 0, exceptions.UNKNOWN_ACTION),
+            (1, self.engine.turn, 1, exceptions.NOT_YOUR_UNIT)])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+import random
+import unittest
+
+from warcode import constants
+from warcode.engine import Engine
+
+
+def make_engine(map_name="Test", num_players=2):
+    """
+    Returns an engine for a map with in process example players
+    """
+    return Engine(map_name, ["exampleplayer.py"] * num_players, "test",
+        quiet=True, seed=1, in_process=True)
+
+
+def close_engine(engine):
+    engine.loop.close()
+    engine.log.close()
+
+
+def visible_squares(engine, team):
+    """
+    Works out the squares a team can see from scratch
+    """
+    game_map = engine.get_game_map()
+    squares = set()
+    for unit in team.get_units().values():
+        distance = unit.get_unit_type().get_visibility_distance()
+        reach = int(distance ** 0.5) + 1
+        for y in range(max(unit.get_y() - reach, 0),
+                min(unit.get_y() + reach + 1, game_map.get_height())):
+            for x in range(max(unit.get_x() - reach, 0),
+                    min(unit.get_x() + reach + 1, game_map.get_width())):
+                if (x - unit.get_x()) ** 2 + (y - unit.get_y()) ** 2 <= distance:
+                    squares.add((x, y))
+    return squares
+
+
+class TestFogOfWar(unittest.TestCase):
+    map_name = "Test"
+    num_players = 2
+
+    def setUp(self):
+        self.engine = make_engine(self.map_name, self.num_players)
+        self.random = random.Random(0)
+
+    def tearDown(self):
+        close_engine(self.engine)
+
+    def empty_square(self):
+        game_map = self.engine.get_game_map()
+        while True:
+            x = self.random.randrange(game_map.get_width())
+            y = self.random.randrange(game_map.get_height())
+            if game_map.get_square_at(x, y) == constants.EMPTY:
+                return x, y
+
+    def change_something(self):
+        """
+        Creates, moves or removes a unit, or cuts down a tree
+        """
+        engine = self.engine
+        units = list(engine.get_units().values())
+        choice = self.random.random()
+        if choice < 0.3 or not units:
+            team = self.random.choice(list(engine.get_teams().values()))
+            unit_type = self.random.choice(
+                [constants.PEASANT, constants.KNIGHT, constants.ARCHER])
+            engine.create_unit(*self.empty_square(), unit_type, team)
+        elif choice < 0.8:
+            unit = self.random.choice(units)
+            old_x, old_y = unit.get_x(), unit.get_y()
+            x, y = self.empty_square()
+            engine.get_game_map().set_square_at(old_x, old_y, constants.EMPTY)
+            engine.get_game_map().set_square_at(x, y, unit.get_id())
+            unit.x, unit.y = x, y
+            engine.move_unit(unit, old_x, old_y)
+        elif choice < 0.9 and engine.get_trees():
+            engine.remove_tree(
+                self.random.choice(list(engine.get_trees().values())))
+        else:
+            engine.remove_unit(self.random.choice(units))
+
+    def check_views(self):
+        engine = self.engine
+        game_map = engine.get_game_map()
+        masks = {}
+        for team in engine.get_teams().values():
+            fog = engine.get_fog_of_war(team)
+            squares = visible_squares(engine, team)
+            for y in range(game_map.get_height()):
+                for x in range(game_map.get_width()):
+                    if (x, y) in squares:
+                        expected = game_map.get_square_at(x, y)
+                        masks[x, y] = masks.get((x, y), 0) | fog.bit
+                    else:
+                        expected = constants.INVISIBLE
+                    self.assertEqual(fog.is_visible(x, y), (x, y) in squares)
+                    self.assertEqual(fog.get_board()[y][x], expected)
+            things = {
+                id: thing for id, thing in engine.things.items()
+                if id not in engine.get_teams()
+                and (thing.get_x(), thing.get_y()) in squares
+            }
+            self.assertEqual(fog.get_visible_things(), things)
+        for y in range(game_map.get_height()):
+            for x in range(game_map.get_width()):
+                self.assertEqual(engine.visibility.get_mask(x, y),
+                    masks.get((x, y), 0))
+
+    def test_matches_brute_force(self):
+        self.check_views()
+        for i in range(200):
+            self.change_something()
+            if i % 20 == 0:
+                self.check_views()
+        self.check_views()
+
+
+class TestManyTeams(TestFogOfWar):
+    """
+    The same checks with six teams sharing each square's bitmask
+    """
+    map_name = "Big"
+    num_players = 6
+
+
+if __name__ == "__main__":
+    unittest.main()
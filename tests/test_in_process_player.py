@@ -0,0 +1,60 @@
+#!/usr/bin/env python3
+import asyncio
+import os
+import sys
+import tempfile
+import unittest
+
+from warcode.engine import InProcessPlayer
+
+# A player that imports a module kept next to it
+SIBLING_PLAYER = """
+from warcode_starter import Player
+from sibling_strategy import NAME
+
+if __name__ == "__main__":
+    Player(NAME)
+"""
+
+
+class TestInProcessPlayer(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.loop = asyncio.new_event_loop()
+
+    def tearDown(self):
+        self.loop.close()
+        self.directory.cleanup()
+
+    def start_player(self, name):
+        """
+        Starts a player in a directory of its own, next to a sibling_strategy
+        module naming it name
+        """
+        directory = os.path.join(self.directory.name, name)
+        os.mkdir(directory)
+        with open(os.path.join(directory, "sibling_strategy.py"), "w") as f:
+            f.write("NAME = {!r}\n".format(name))
+        player_file = os.path.join(directory, "player.py")
+        with open(player_file, "w") as f:
+            f.write(SIBLING_PLAYER)
+        player = InProcessPlayer(player_file)
+        self.loop.run_until_complete(player.start())
+        return player
+
+    def test_imports_sibling_modules(self):
+        path = sys.path[:]
+        player = self.start_player("sibling")
+        self.assertEqual(player.player.name, "sibling")
+        self.assertEqual(sys.path, path)
+        self.assertNotIn("sibling_strategy", sys.modules)
+
+    def test_modules_with_the_same_name(self):
+        first = self.start_player("first")
+        second = self.start_player("second")
+        self.assertEqual(first.player.name, "first")
+        self.assertEqual(second.player.name, "second")
+
+
+if __name__ == "__main__":
+    unittest.main()
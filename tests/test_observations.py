@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+import json
+import random
+import unittest
+
+from warcode import constants
+from warcode.engine import Engine, Player
+
+
+class DeltaState:
+    """
+    What a player using delta observations knows, updated the way the README
+    says to
+    """
+    def __init__(self, width, height):
+        self.board = [[constants.INVISIBLE] * width for y in range(height)]
+        self.things = {field: {} for field in ("units", "gold_mines", "trees")}
+
+    def apply(self, observation):
+        for x, y, value in observation["squares"]:
+            self.board[y][x] = value
+        for id in observation["removed"]:
+            for things in self.things.values():
+                things.pop(id, None)
+        for field, things in self.things.items():
+            for thing in observation[field]:
+                things[thing["id"]] = thing
+
+
+class TestObservations(unittest.TestCase):
+    def setUp(self):
+        self.engine = Engine("Test", ["exampleplayer.py", "exampleplayer.py"],
+            "test", quiet=True, seed=1, in_process=True)
+        self.engine.game_data["turns"].append([])
+        self.random = random.Random(0)
+
+    def tearDown(self):
+        self.engine.loop.close()
+        self.engine.log.close()
+
+    def observer(self, team, protocol, region=None):
+        """
+        Returns a player on a team that isn't running, to build observations for
+        """
+        player = Player("exampleplayer.py")
+        player.set_team(team)
+        player.protocol = protocol
+        if region is not None:
+            player.set_region(self.engine.clip_region(region))
+        return player
+
+    def play_turn(self):
+        """
+        Has every team take a random legal action with each of its units
+        """
+        for team in list(self.engine.get_teams().values()):
+            self.engine.get_entity_store().reset_actions(team)
+            actions = []
+            for unit in team.get_units().values():
+                choices = self.engine.legal_actions(unit)
+                if choices:
+                    actions.append(self.random.choice(choices))
+            self.engine.apply(actions, team)
+
+    def check_delta_matches_full(self, region=None):
+        game_map = self.engine.get_game_map()
+        team = self.engine.get_teams()[1]
+        full = self.observer(team, constants.FULL_PROTOCOL, region)
+        delta = self.observer(team, constants.DELTA_PROTOCOL, region)
+        self.engine.get_fog_of_war(team).track_changes()
+        state = DeltaState(game_map.get_width(), game_map.get_height())
+        for turn in range(30):
+            expected = json.loads(self.engine.get_data(full))
+            observation = json.loads(self.engine.get_data(delta))
+            state.apply(observation)
+            board = state.board
+            if region is not None:
+                self.assertEqual(observation["origin"], expected["origin"])
+                left, top, right, bottom = delta.get_region()
+                board = [row[left:right] for row in board[top:bottom]]
+            self.assertEqual(board, expected["map"])
+            for field, things in state.things.items():
+                self.assertEqual(
+                    sorted(things.values(), key=lambda thing: thing["id"]),
+                    sorted(expected[field], key=lambda thing: thing["id"]))
+            self.play_turn()
+
+    def test_delta_matches_full(self):
+        self.check_delta_matches_full()
+
+    def test_delta_region_matches_full(self):
+        self.check_delta_matches_full((10, 15, 15, 100))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+import asyncio
+import os
+import tempfile
+import textwrap
+import unittest
+
+from warcode.engine import Player
+
+# A player that answers its first turn, then writes far more than a pipe holds
+# once it is told the game is over
+NOISY_PLAYER = textwrap.dedent("""
+    import sys
+    sys.stdin.readline()
+    print("noisy", flush=True)
+    sys.stdin.readline()
+    for i in range(2000):
+        print("x" * 1000, flush=True)
+""")
+
+
+class TestPlayer(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.loop = asyncio.new_event_loop()
+
+    def tearDown(self):
+        self.loop.close()
+        self.directory.cleanup()
+
+    def write_player(self, source):
+        player_file = os.path.join(self.directory.name, "player.py")
+        with open(player_file, "w") as f:
+            f.write(source)
+        return player_file
+
+    def test_kill_with_unread_output(self):
+        player = Player(self.write_player(NOISY_PLAYER))
+
+        async def play():
+            await player.start()
+            await player.first_turn("{}")
+            await player.end_game(0)
+            # Let it fill the pipe before it's killed
+            await asyncio.sleep(0.5)
+            await player.kill()
+        self.loop.run_until_complete(asyncio.wait_for(play(), 10))
+        self.assertEqual(player.get_name(), "noisy")
+        self.assertIsNotNone(player.process.returncode)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+import io
+import json
+import unittest
+
+from warcode import constants, protocol
+from warcode.engine import Engine, Player
+
+
+class TestProtocol(unittest.TestCase):
+    def test_frame(self):
+        stream = io.BytesIO(protocol.frame(protocol.ACTIONS, b"[]")
+            + protocol.frame(protocol.END, b""))
+        self.assertEqual(protocol.read_frame(stream), (protocol.ACTIONS, b"[]"))
+        self.assertEqual(protocol.read_frame(stream), (protocol.END, b""))
+
+    def test_round_trip(self):
+        # A 3 by 2 board whose top left square is (4, 7), with a unit on it
+        rows = [protocol.encode_row(["E", 12, "T"]),
+            protocol.encode_row(["B", "G", "E"])]
+        units = [protocol.UNIT_RECORD.pack(12, constants.UNIT_TYPES.index(
+            constants.PEASANT), 30, 1, 5, 7, 4, 2)]
+        gold_mines = [protocol.GOLD_MINE_RECORD.pack(13, 5, 8, 500)]
+        trees = [protocol.TREE_RECORD.pack(14, 6, 7, 200)]
+        buffer = protocol.encode_observation(0.5, 300, 100, rows, units,
+            gold_mines, trees, (4, 7))
+        for data in (buffer, memoryview(bytearray(buffer))):
+            self.assertEqual(protocol.decode_observation(data), {
+                "time": 0.5,
+                "units": [{"id": 12, "type": "PEASANT", "health": 30,
+                    "team": 1, "x": 5, "y": 7, "gold": 4, "wood": 2}],
+                "gold_mines": [{"id": 13, "gold": 500, "x": 5, "y": 8}],
+                "trees": [{"id": 14, "wood": 200, "x": 6, "y": 7}],
+                "gold": 300,
+                "wood": 100,
+                "map": [["E", 12, "T"], ["B", "G", "E"]],
+                "origin": [4, 7]
+            })
+
+    def test_no_board(self):
+        buffer = protocol.encode_observation(1.0, 0, 0, [], [], [], [])
+        self.assertEqual(protocol.decode_observation(buffer, ("trees",)),
+            {"time": 1.0, "trees": [], "gold": 0, "wood": 0})
+
+
+class TestBinaryObservations(unittest.TestCase):
+    """
+    Checks the engine's binary observations decode to its json ones
+    """
+    def setUp(self):
+        self.engine = Engine("Test", ["exampleplayer.py", "exampleplayer.py"],
+            "test", quiet=True, seed=1, in_process=True)
+        self.team = self.engine.get_teams()[1]
+
+    def tearDown(self):
+        self.engine.loop.close()
+        self.engine.log.close()
+
+    def observations(self, region=None):
+        """
+        Returns the team's json observation and its binary one decoded
+        """
+        observations = []
+        for kind in (constants.FULL_PROTOCOL, constants.BINARY_PROTOCOL):
+            player = Player("exampleplayer.py")
+            player.set_team(self.team)
+            player.protocol = kind
+            if region is not None:
+                player.set_region(self.engine.clip_region(region))
+            observations.append(self.engine.get_data(player))
+        full, binary = observations
+        return json.loads(full), protocol.decode_observation(binary)
+
+    def by_id(self, things):
+        return sorted(things, key=lambda thing: thing["id"])
+
+    def check_same(self, full, binary):
+        self.assertEqual(binary["time"], full["time"])
+        self.assertEqual(binary["map"], full["map"])
+        for field in ("gold", "wood"):
+            self.assertEqual(binary[field], full[field])
+        for field in ("units", "gold_mines", "trees"):
+            self.assertEqual(self.by_id(binary[field]),
+                self.by_id(full[field]))
+
+    def test_whole_map(self):
+        full, binary = self.observations()
+        self.check_same(full, binary)
+        self.assertEqual(binary["origin"], [0, 0])
+
+    def test_region(self):
+        full, binary = self.observations((10, 15, 25, 40))
+        self.check_same(full, binary)
+        self.assertEqual(len(binary["map"]), 15)
+        self.assertEqual(len(binary["map"][0]), 15)
+        self.assertEqual(binary["origin"], full["origin"])
+        self.assertEqual(binary["origin"], [10, 15])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,64 @@
+#!/usr/bin/env python3
+import asyncio
+import os
+import signal
+import tempfile
+import unittest
+
+from warcode.engine import Spawner
+from warcode.engine.spawner import UNKNOWN_STATUS
+
+# A player that exits with its own status once it reads a line
+EXITING_PLAYER = "import sys\nsys.stdin.readline()\nsys.exit(3)\n"
+
+
+class TestSpawner(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.player_file = os.path.join(self.directory.name, "player.py")
+        with open(self.player_file, "w") as f:
+            f.write(EXITING_PLAYER)
+        self.spawner = Spawner()
+        self.loop = asyncio.new_event_loop()
+
+    def tearDown(self):
+        self.loop.close()
+        self.spawner.close()
+        self.directory.cleanup()
+
+    def test_exit_status(self):
+        async def run():
+            exiting = await self.spawner.spawn(self.player_file)
+            killed = await self.spawner.spawn(self.player_file)
+            exiting.stdin.write(b"\n")
+            killed.kill()
+            statuses = await asyncio.wait_for(
+                asyncio.gather(exiting.wait(), killed.wait()), 10)
+            # Once collected, its pid may belong to someone else
+            with self.assertRaises(ProcessLookupError):
+                killed.kill()
+            return statuses
+        self.assertEqual(self.loop.run_until_complete(run()),
+            [3, -signal.SIGKILL])
+
+    def test_already_collected(self):
+        async def run():
+            process = await self.spawner.spawn(self.player_file)
+            process.stdin.write(b"\n")
+            await process.stdin.drain()
+            while not process.has_ended():
+                await asyncio.sleep(0.001)
+            self.assertEqual(await self.spawner.collect(process.pid), 3)
+            self.assertIsNone(await self.spawner.collect(process.pid))
+            return await asyncio.wait_for(process.wait(), 10)
+        self.assertEqual(self.loop.run_until_complete(run()), UNKNOWN_STATUS)
+
+    def test_template_exited(self):
+        self.spawner.template.kill()
+        self.spawner.template.wait()
+        with self.assertRaises(RuntimeError):
+            self.loop.run_until_complete(self.spawner.spawn(self.player_file))
+
+
+if __name__ == "__main__":
+    unittest.main()
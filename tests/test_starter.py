@@ -0,0 +1,99 @@
+#!/usr/bin/env python3
+import unittest
+
+from warcode import constants
+from warcode.engine import Engine
+
+
+class TestStarterActions(unittest.TestCase):
+    """
+    Plays turns of a starter kit player through the engine, checking the
+    actions it sends are carried out
+    """
+    def setUp(self):
+        self.engine = Engine("Test", ["exampleplayer.py", "exampleplayer.py"],
+            "test", quiet=True, seed=1, in_process=True)
+        self.player = self.engine.players[0]
+        self.team = self.player.get_team()
+        self.starter = self.player.player
+        self.starter._start(self.engine.get_first_turn_data(self.player))
+
+    def tearDown(self):
+        self.engine.loop.close()
+        self.engine.log.close()
+
+    def play(self, turn):
+        """
+        Plays a turn where the starter player calls turn with itself, returning
+        the actions it sent
+        """
+        self.engine.turn += 1
+        self.engine.game_data["turns"].append([])
+        self.engine.entity_store.reset_actions(self.team)
+        self.starter.turn = lambda: turn(self.starter)
+        actions = self.starter._play(self.engine.get_data(self.player))
+        self.engine.process_actions(actions, self.team)
+        self.assertEqual(self.engine.get_action_errors(), [])
+        return actions
+
+    def our_unit(self, unit_type):
+        for unit in self.team.get_units().values():
+            if unit.get_unit_type() == unit_type:
+                return unit
+
+    def empty_neighbor(self, unit):
+        game_map = self.engine.get_game_map()
+        for dx, dy in constants.NEIGHBOR_STENCIL:
+            x, y = unit.get_x() + dx, unit.get_y() + dy
+            if (game_map.in_bounds(x, y)
+                    and game_map.get_square_at(x, y) == constants.EMPTY):
+                return x, y
+
+    def test_build(self):
+        castle = self.our_unit(constants.CASTLE)
+        x, y = self.empty_neighbor(castle)
+        actions = self.play(lambda starter: starter.build(
+            starter.units[castle.get_id()], constants.PEASANT, x, y))
+        self.assertEqual(len(actions), 1)
+        self.assertEqual(
+            self.engine.get_unit_at(x, y).get_unit_type(), constants.PEASANT)
+
+    def test_give(self):
+        castle = self.our_unit(constants.CASTLE)
+        x, y = self.empty_neighbor(castle)
+        self.play(lambda starter: starter.build(
+            starter.units[castle.get_id()], constants.PEASANT, x, y))
+        peasant = self.engine.get_unit_at(x, y)
+        actions = self.play(lambda starter: starter.give(
+            starter.units[peasant.get_id()], starter.units[castle.get_id()],
+            0, 0))
+        self.assertEqual(len(actions), 1)
+        self.assertEqual(actions[0]["type"], constants.GIVE)
+
+    def test_actions_match_schema(self):
+        castle = self.our_unit(constants.CASTLE)
+        peasant = self.our_unit(constants.PEASANT) or castle
+        x, y = self.empty_neighbor(castle)
+        starter = self.starter
+        starter.turn = lambda: None
+        starter._play(self.engine.get_data(self.player))
+        ours = starter.units[castle.get_id()]
+        other = starter.units[peasant.get_id()]
+        starter.move(ours, x, y)
+        starter.attack(ours, x, y)
+        starter.build(ours, constants.PEASANT, x, y)
+        starter.give(ours, other, 0, 0)
+        starter.cut(ours, *next(iter(starter.trees.values())).get_location())
+        starter.mine(ours,
+            *next(iter(starter.gold_mines.values())).get_location())
+        starter.log("message")
+        self.assertEqual([action["type"] for action in starter.actions],
+            [constants.MOVE, constants.ATTACK, constants.BUILD, constants.GIVE,
+                constants.CUT, constants.MINE, constants.LOG])
+        for action in starter.actions:
+            self.assertIsNone(self.engine.check_action(action, self.team),
+                action)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,4 +1,5 @@
 #!/usr/bin/env python3
+import functools
 import json
 import os
 
@@ -13,6 +14,7 @@ TREE = _data["TREE"]
 GOLD_MINE = _data["GOLD_MINE"]
 INVISIBLE = _data["INVISIBLE"]
 
+MOVE = _data["MOVE"]
 ATTACK = _data["ATTACK"]
 BUILD = _data["BUILD"]
 GIVE = _data["GIVE"]
@@ -20,6 +22,38 @@ MINE = _data["MINE"]
 CUT = _data["CUT"]
 LOG = _data["LOG"]
 
+FULL_PROTOCOL = _data["FULL_PROTOCOL"]
+DELTA_PROTOCOL = _data["DELTA_PROTOCOL"]
+BINARY_PROTOCOL = _data["BINARY_PROTOCOL"]
+SHARED_MEMORY_PROTOCOL = _data["SHARED_MEMORY_PROTOCOL"]
+PROTOCOLS = (FULL_PROTOCOL, DELTA_PROTOCOL, BINARY_PROTOCOL,
+    SHARED_MEMORY_PROTOCOL)
+# The parts of an observation a player can choose to be sent
+OBSERVATION_FIELDS = tuple(_data["OBSERVATION_FIELDS"])
+
+# Seconds players have to answer.  Time left over from a turn is saved in a
+# bank of up to TIME_BANK seconds that is added to the next turn's time.
+FIRST_TURN_TIME = _data["FIRST_TURN_TIME"]
+TIME_PER_TURN = _data["TIME_PER_TURN"]
+TIME_BANK = _data["TIME_BANK"]
+
+# CPU seconds players may use each turn, banked the same way.  Unlike their
+# time, this doesn't depend on what else is running on the machine.
+CPU_TIME_PER_TURN = _data["CPU_TIME_PER_TURN"]
+CPU_TIME_BANK = _data["CPU_TIME_BANK"]
+
+# The most bytes of a player's message that are read; the rest is skipped.
+MAX_MESSAGE_SIZE = _data["MAX_MESSAGE_SIZE"]
+
+# The most characters of a LOG message that are kept, and of all of a
+# player's LOG messages in a game.  The engine keeps the last LOG_BUFFER_SIZE
+# log records in memory, and drops records if more than LOG_QUEUE_SIZE are
+# waiting to be written.
+LOG_MESSAGE_SIZE = _data["LOG_MESSAGE_SIZE"]
+LOG_SIZE = _data["LOG_SIZE"]
+LOG_BUFFER_SIZE = _data["LOG_BUFFER_SIZE"]
+LOG_QUEUE_SIZE = _data["LOG_QUEUE_SIZE"]
+
 MINE_AMOUNT = _data["MINE_AMOUNT"]
 CUT_AMOUNT = _data["CUT_AMOUNT"]
 GOLD_MINE_HEALTH = _data["GOLD_MINE_HEALTH"]
@@ -27,6 +61,38 @@ TREE_HEALTH = _data["TREE_HEALTH"]
 INITIAL_GOLD = _data["INITIAL_GOLD"]
 INITIAL_WOOD = _data["INITIAL_WOOD"]
 
+# Units can only build, mine, cut and give within this distance squared
+NEIGHBOR_DISTANCE = 2
+
+
+@functools.lru_cache(maxsize=None)
+def annulus_stencil(min_distance, max_distance):
+    """
+    Returns a tuple of the offsets (dx, dy) whose distance squared from
+    (0, 0) is between min_distance and max_distance inclusive, in row order
+    """
+    if max_distance < 0:
+        return ()
+    radius = int(max_distance ** 0.5)
+    return tuple(
+        (dx, dy)
+        for dy in range(-radius, radius + 1)
+        for dx in range(-radius, radius + 1)
+        if min_distance <= dx**2 + dy**2 <= max_distance
+    )
+
+
+def disk_stencil(distance):
+    """
+    Returns a tuple of the offsets (dx, dy) whose distance squared from
+    (0, 0) is at most distance, in row order
+    """
+    return annulus_stencil(0, distance)
+
+
+NEIGHBOR_STENCIL = disk_stencil(NEIGHBOR_DISTANCE)
+
+
 class UnitType:
     def __init__(self, name, initial_health, movement_speed, min_attack_distance,
             max_attack_distance, attack_damage, attack_splash, visibility_distance,
@@ -72,6 +138,30 @@ class UnitType:
     def get_wood_cost(self):
         return self.wood_cost
 
+    def get_movement_stencil(self):
+        """
+        Returns the offsets a unit of this type can move by
+        """
+        return disk_stencil(self.movement_speed)
+
+    def get_attack_stencil(self):
+        """
+        Returns the offsets a unit of this type can attack
+        """
+        return annulus_stencil(self.min_attack_distance, self.max_attack_distance)
+
+    def get_splash_stencil(self):
+        """
+        Returns the offsets from an attacked square that the attack hits
+        """
+        return disk_stencil(self.attack_splash)
+
+    def get_visibility_stencil(self):
+        """
+        Returns the offsets a unit of this type can see
+        """
+        return disk_stencil(self.visibility_distance)
+
     def __str__(self):
         return self.name
 
@@ -86,6 +176,9 @@ PEASANT = UnitType(**_data["PEASANT"])
 TOTEM = UnitType(**_data["TOTEM"])
 TOWER = UnitType(**_data["TOWER"])
 
+UNIT_TYPES = (ARCHER, CASTLE, FORTRESS, KNIGHT, LANDMINE, MAGE, PEASANT, TOTEM, TOWER)
+UNIT_TYPES_BY_NAME = {unit_type.get_name(): unit_type for unit_type in UNIT_TYPES}
+
 ALLOWED_CREATIONS = {}
 for unit, allowed_units in _data["ALLOWED_CREATIONS"].items():
     ALLOWED_CREATIONS[globals()[unit]] = set(globals()[other] for other in allowed_units)
@@ -1,10 +1,18 @@
 #!/usr/bin/env python3
-__all__ = ["Engine", "GoldMine", "Map", "Player", "Team", "Tree", "Unit"]
+__all__ = ["ArrayMap", "Engine", "EntityStore", "FogOfWar", "GameLog", "GoldMine", "InProcessPlayer", "Map", "Player", "PlayerPool", "SpatialGrid", "Spawner", "Team", "Tree", "Unit", "Visibility"]
 
+from .entity_store import EntityStore
 from .game_map import Map
+from .array_map import ArrayMap
 from .gold_mine import GoldMine
-from .player import Player
+from .game_log import GameLog
+from .player import Player, PlayerPool
+from .in_process_player import InProcessPlayer
 from .team import Team
 from .tree import Tree
 from .unit import Unit
+from .fog_of_war import FogOfWar
+from .spatial_grid import SpatialGrid
+from .spawner import Spawner
+from .visibility import Visibility
 from .engine import Engine
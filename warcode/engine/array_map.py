@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from warcode import constants
+from warcode.engine import Map
+
+# The terrain layer stores the index of a square's symbol in this list.  Any
+# square holding a unit is marked UNIT and its id is kept in the occupant layer.
+SYMBOLS = [
+    constants.EMPTY,
+    constants.BLOCK,
+    constants.TREE,
+    constants.GOLD_MINE,
+    constants.INVISIBLE
+]
+CODES = {symbol: code for code, symbol in enumerate(SYMBOLS)}
+UNIT = len(SYMBOLS)
+
+
+class ArrayMap(Map):
+    """
+    A map whose board is stored as NumPy arrays: a uint8 terrain layer and a
+    uint32 layer with the id of the unit on each square.  It behaves like Map,
+    but the board is only turned back into lists when get_board is called.
+    """
+    def __init__(self, map_name):
+        if np is None:
+            raise ImportError("ArrayMap requires numpy to be installed.")
+        super().__init__(map_name)
+
+        self.terrain = np.full((self.height, self.width), CODES[constants.EMPTY],
+            dtype=np.uint8)
+        self.occupants = np.zeros((self.height, self.width), dtype=np.uint32)
+        for y, row in enumerate(self.board):
+            for x, value in enumerate(row):
+                self._store(x, y, value)
+        del self.board
+
+    def _store(self, x, y, value):
+        """
+        Writes a square's value into the terrain and occupant layers
+        """
+        if isinstance(value, str):
+            self.terrain[y, x] = CODES[value]
+            self.occupants[y, x] = 0
+        else:
+            self.terrain[y, x] = UNIT
+            self.occupants[y, x] = value
+
+    def get_board(self):
+        """
+        Returns the board as a list of lists, the way it is sent to players
+        """
+        return self.to_list()
+
+    def get_square_at(self, x, y):
+        code = self.terrain[y, x]
+        if code == UNIT:
+            return int(self.occupants[y, x])
+        return SYMBOLS[code]
+
+    def set_square_at(self, x, y, value):
+        self._store(x, y, value)
+        for listener in self.listeners:
+            listener(x, y, value)
+
+    def copy(self):
+        """
+        Returns a copy of the map, without any listeners
+        """
+        game_map = ArrayMap.__new__(ArrayMap)
+        game_map.__dict__.update(self.__dict__)
+        game_map.terrain = self.terrain.copy()
+        game_map.occupants = self.occupants.copy()
+        game_map.listeners = []
+        return game_map
+
+    def get_mask(self, value):
+        """
+        Returns a boolean array that is True on every square holding value,
+        which is one of the map symbols (EMPTY, BLOCK, TREE, GOLD_MINE)
+        """
+        return self.terrain == CODES[value]
+
+    def get_unit_mask(self):
+        """
+        Returns a boolean array that is True on every square holding a unit
+        """
+        return self.terrain == UNIT
+
+    def get_gold_mine_locations(self):
+        """
+        Returns a generator of the locations with gold mines at them
+        """
+        for y, x in np.argwhere(self.get_mask(constants.GOLD_MINE)):
+            yield (int(x), int(y))
+
+    def get_tree_locations(self):
+        """
+        Returns a generator of the locations with trees at them
+        """
+        for y, x in np.argwhere(self.get_mask(constants.TREE)):
+            yield (int(x), int(y))
+
+    def to_list(self, visible=None):
+        """
+        Converts the board to a list of lists.  If a boolean visible array is
+        given, every square where it is False becomes INVISIBLE.
+        """
+        board = np.array(SYMBOLS + [None], dtype=object)[self.terrain]
+        units = self.get_unit_mask()
+        board[units] = self.occupants[units].astype(object)
+        if visible is not None:
+            board[~visible] = constants.INVISIBLE
+        return board.tolist()
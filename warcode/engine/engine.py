@@ -1,33 +1,93 @@
 #!/usr/bin/env python3
+import asyncio
 import json
 import random
-import traceback
 import os
 
-from warcode import constants
+from warcode import constants, exceptions, protocol
 from warcode.exceptions import InvalidAction
-from warcode.engine import Unit, Map, GoldMine, Player, Tree, Team
+from warcode.engine import (
+    Unit, Map, ArrayMap, GoldMine, Player, InProcessPlayer, Tree, Team,
+    SpatialGrid, EntityStore, Visibility, GameLog
+)
 
 my_dir = os.path.realpath(os.path.dirname(__file__))
 
+# The fields each kind of action needs, and the type each must have (None
+# for any json value)
+ACTION_FIELDS = {
+    constants.MOVE: (("unit", int), ("x", int), ("y", int)),
+    constants.ATTACK: (("unit", int), ("x", int), ("y", int)),
+    constants.BUILD: (("unit", int), ("unit_type", str), ("x", int), ("y", int)),
+    constants.GIVE: (("unit", int), ("other", int), ("gold", int), ("wood", int)),
+    constants.CUT: (("unit", int), ("x", int), ("y", int)),
+    constants.MINE: (("unit", int), ("x", int), ("y", int)),
+    constants.LOG: (("message", None),)
+}
+
 class Engine:
     """
-    Overall engine class.  Runs a game.
+    Overall engine class.  Runs a game.  In simultaneous mode every player is
+    sent the state at the start of the turn and they all think at once,
+    rather than one after another.  Each player starts thinking as soon as
+    its own observation is built, while the next player's is.  Players built
+    on warcode_starter can be run in_process, inside the engine's own
+    process.  Giving a PlayerPool reuses player processes from earlier games
+    (so it can't be given for in_process players), and giving a Spawner forks
+    new ones from a template process.  Cooperative players' processes aren't
+    suspended between turns.  A pool starts its players with its own spawner
+    and cooperative setting, so neither can be given along with one.
+    Rejected actions are counted for each player in the saved game, and only
+    logged if print_errors.  Players' LOG actions are logged, and written to
+    a file for each player in log_dir if it is given.
     """
 
-    def __init__(self, map_name, players, save_file, quiet=False):
-        self.game_map = Map(map_name)
+    def __init__(self, map_name, players, save_file, quiet=False,
+            array_map=False, seed=None, simultaneous=False,
+            in_process=False, pool=None,
+            spawner=None, cooperative=False, print_errors=False,
+            log_dir=None):
+        if in_process and pool is not None:
+            raise ValueError("In process players can't come from a pool.")
+        if pool is not None and (spawner is not None or cooperative):
+            raise ValueError("Players from a pool are started with the "
+                "pool's spawner and cooperative setting.")
+        # The array backed map needs numpy, so it is only used if asked for
+        if array_map:
+            self.game_map = ArrayMap(map_name)
+        else:
+            self.game_map = Map(map_name)
         self.quiet = quiet
+        self.print_errors = print_errors
+        # A (team id, turn, index in its actions, code) record for every
+        # action that was rejected, and how many of each code each team got
+        self.action_errors = []
+        self.error_counts = {}
+        self.simultaneous = simultaneous
         if not save_file.endswith(".wcr"):
             save_file += ".wcr"
         self.save_file = save_file
+        self.log = GameLog(quiet, log_dir, save_file[:-len(".wcr")])
+
+        # Each engine has its own random number generator so games don't
+        # affect each other and can be replayed from their seed.
+        if seed is None:
+            seed = random.randrange(2**32)
+        self.seed = seed
+        self.random = random.Random(seed)
 
         self.ids_given = set()
+        self.entity_store = EntityStore(self)
         self.things = {}
+        self.grid = SpatialGrid(self.game_map.get_width(),
+            self.game_map.get_height())
 
         self.teams = {}
+        self.visibility = Visibility(self)
         for i in range(self.game_map.get_num_teams()):
             self.teams[i + 1] = Team(i + 1)
+            self.entity_store.add_team(self.teams[i + 1])
+            self.visibility.add_team(self.teams[i + 1])
 
         self.things.update(self.teams)
 
@@ -38,9 +98,23 @@ class Engine:
         for x, y in self.game_map.get_tree_locations():
             self.create_tree(x, y)
 
-        # Randomly order the players
-        players = random.sample(players, len(players))
-        self.players = [Player(player) for player in players]
+        # Randomly order the players.  Their processes are run from our own
+        # event loop, or the pool's if they come from one.
+        players = self.random.sample(players, len(players))
+        self.defeated_players = []
+        self.pool = pool
+        if pool is not None:
+            self.loop = pool.get_loop()
+            self.players = self.run_all(
+                pool.acquire(player) for player in players)
+        else:
+            if in_process:
+                self.players = [InProcessPlayer(player) for player in players]
+            else:
+                self.players = [Player(player, spawner, cooperative)
+                    for player in players]
+            self.loop = asyncio.new_event_loop()
+            self.run_all(player.start() for player in self.players)
         # Assign each player a team
         for player, team in zip(self.players, self.teams.values()):
             player.set_team(team)
@@ -54,14 +128,88 @@ class Engine:
         self.finished = False
         self.turn = 0
 
+        self.headless = False
         self.game_data = {
-            "map": self.game_map.get_board(),
+            "map": [list(row) for row in self.game_map.get_board()],
             "players": [{"team": player.team.get_id()} for player in self.players],
             "initial_units": [unit.to_dict() for unit in self.units.values()],
             "turns": [],
-            "winner": None
+            "winner": None,
+            "seed": self.seed,
+            "simultaneous": self.simultaneous
         }
 
+    def clone(self):
+        """
+        Returns a headless copy of the game for looking ahead.  The copy has
+        no players and does no I/O, and changing it doesn't change us.  Use
+        apply to play actions on it.
+        """
+        engine = Engine.__new__(Engine)
+        engine.game_map = self.game_map.copy()
+        engine.quiet = True
+        engine.print_errors = False
+        engine.action_errors = []
+        engine.error_counts = {}
+        engine.log = GameLog(headless=True)
+        engine.simultaneous = self.simultaneous
+        engine.save_file = None
+        engine.headless = True
+        engine.seed = self.seed
+        engine.random = random.Random()
+        engine.random.setstate(self.random.getstate())
+        engine.ids_given = set(self.ids_given)
+
+        engine.teams = {id: team.copy() for id, team in self.teams.items()}
+        engine.things = dict(engine.teams)
+        engine.entity_store = self.entity_store.copy(engine, engine.teams)
+        engine.units = {}
+        for id, unit in self.units.items():
+            unit = Unit.view(engine.entity_store, unit.index)
+            engine.units[id] = unit
+            unit.get_team().add_unit(unit)
+        engine.gold_mines = {
+            id: GoldMine.view(engine.entity_store, gold_mine.index)
+            for id, gold_mine in self.gold_mines.items()
+        }
+        engine.trees = {
+            id: Tree.view(engine.entity_store, tree.index)
+            for id, tree in self.trees.items()
+        }
+        for things in (engine.units, engine.gold_mines, engine.trees):
+            engine.things.update(things)
+        engine.grid = self.grid.copy(engine.things)
+
+        engine.visibility = self.visibility.copy(engine)
+
+        engine.players = []
+        engine.defeated_players = []
+        engine.loop = None
+        engine.pool = None
+        engine.finished = self.finished
+        engine.turn = self.turn
+        engine.game_data = {"turns": [[]], "winner": None}
+        return engine
+
+    def run_all(self, coroutines):
+        """
+        Runs coroutines, such as players' turns, at the same time on our event
+        loop and returns a list of their results
+        """
+        async def gather():
+            return await asyncio.gather(*coroutines)
+        return self.loop.run_until_complete(gather())
+
+    def apply(self, actions, team):
+        """
+        Plays a list of actions (dictionaries in the format players send) for
+        a team, starting a new turn for its units first
+        """
+        if not isinstance(team, Team):
+            team = self.teams[team]
+        self.entity_store.reset_actions(team)
+        self.process_actions(actions, team)
+
     def play(self):
         """
         Play the game, returning the winning player
@@ -69,7 +217,12 @@ class Engine:
         self.turn += 1
         for player in self.players:
             data = self.get_first_turn_data(player)
-            player.first_turn(data)
+            self.loop.run_until_complete(player.first_turn(data))
+            if player.get_region() is not None:
+                player.set_region(self.clip_region(player.get_region()))
+            if (player.get_protocol() == constants.DELTA_PROTOCOL
+                    and "map" in player.get_fields()):
+                self.get_fog_of_war(player.get_team()).track_changes()
 
         while not self.finished:
             self.step()
@@ -81,21 +234,56 @@ class Engine:
         try:
             self.turn += 1
             self.game_data["turns"].append([])
-            for player in self.players:
-                data = self.get_data(player)
-                actions = player.turn(data)
-                self.process_actions(actions, player.get_team())
+            if self.simultaneous:
+                self.simultaneous_step()
+            else:
+                for player in self.players:
+                    self.entity_store.reset_actions(player.get_team())
+                    data = self.get_data(player)
+                    actions = self.loop.run_until_complete(player.turn(data))
+                    self.process_actions(actions, player.get_team())
 
             for player in self.players[:]:
                 if not player.is_alive():
                     self.remove_player(player)
 
+            self.log.flush()
             if len(self.players) <= 1 or self.turn >= 1000:
                 self.end()
         except KeyboardInterrupt:
-            print("Keyboard interrupt. Cleaning up nicely...")
+            self.log.info("Keyboard interrupt. Cleaning up nicely...")
             self.clean_up()
 
+    def simultaneous_step(self):
+        """
+        Sends every player the state at the start of the turn, waits for all of
+        their actions at once and then carries them out.  The player whose
+        actions go first moves round by one each turn.
+        """
+        for player in self.players:
+            self.entity_store.reset_actions(player.get_team())
+        replies = self.run_all(
+            self.simultaneous_turn(player) for player in self.players)
+
+        first = self.turn % len(self.players)
+        order = list(zip(self.players, replies))
+        for player, actions in order[first:] + order[:first]:
+            self.process_actions(actions, player.get_team())
+
+    async def simultaneous_turn(self, player):
+        """
+        Builds a player's observation and then plays its turn.  The turns are
+        started one after another, so the next observation is built while
+        this player thinks.  Nothing changes the state until every player has
+        answered, and only one observation is built at a time, so the caches
+        shared between players' observations are filled without races.
+        """
+        # Observations aren't built in parallel.  Building them is pure
+        # Python, so threads don't help, and a process forked each turn to
+        # build them costs more than building them here: it has to fork and
+        # fill its caches from scratch every turn, while ours stay warm.
+        return await player.turn(self.get_data(player))
+
     def end(self):
         """
         End the game and clean up
@@ -104,7 +292,7 @@ class Engine:
             self.game_data["winner"] = "TIE"
         else:
             # TODO implement tie breaking
-            self.game_data["winner"] = random.choice(self.players).get_name()
+            self.game_data["winner"] = self.random.choice(self.players).get_name()
 
         self.clean_up()
 
@@ -117,13 +305,16 @@ class Engine:
     def get_game_map(self):
         return self.game_map
 
+    def get_entity_store(self):
+        return self.entity_store
+
     def generate_id(self):
         """
         Creates a random, unique 32 bit integer id
         """
-        id = random.randint(0, 2**32 - 1)
+        id = self.random.randint(0, 2**32 - 1)
         while id in self.ids_given:
-            id = random.randint(0, 2**32 - 1)
+            id = self.random.randint(0, 2**32 - 1)
 
         self.ids_given.add(id)
         return id
@@ -135,6 +326,52 @@ class Engine:
         del self.teams[team.get_id()]
         del self.things[team.get_id()]
 
+    def get_fog_of_war(self, team):
+        """
+        Returns what a team can see of the map
+        """
+        return self.visibility.get_fog_of_war(team)
+
+    def get_thing_at(self, x, y):
+        """
+        Returns the unit, tree or gold mine at (x, y), or None if there is
+        nothing there
+        """
+        return self.grid.get_at(x, y)
+
+    def get_unit_at(self, x, y):
+        """
+        Returns the unit at (x, y), or None if there is no unit there
+        """
+        thing = self.grid.get_at(x, y)
+        if thing is not None and thing.get_id() in self.units:
+            return thing
+        return None
+
+    def get_things_near(self, x, y, distance):
+        """
+        Returns a list of the units, trees and gold mines whose distance
+        squared to (x, y) is at most distance
+        """
+        return self.grid.get_in_radius(x, y, distance)
+
+    def add_thing(self, thing):
+        """
+        Puts a unit, tree or gold mine on the map where every team can see it
+        """
+        self.things[thing.get_id()] = thing
+        self.grid.insert(thing)
+        self.visibility.add_thing(thing)
+
+    def remove_thing(self, thing):
+        """
+        Takes a unit, tree or gold mine off the map
+        """
+        del self.things[thing.get_id()]
+        self.grid.remove(thing)
+        self.visibility.remove_thing(thing)
+        self.entity_store.release(thing.index)
+
     def get_units(self):
         return self.units
 
@@ -145,51 +382,85 @@ class Engine:
         id = self.generate_id()
         unit = Unit(id, x, y, unit_type, team, self)
         self.units[id] = unit
-        self.things[id] = unit
         team.add_unit(unit)
         self.game_map.set_square_at(x, y, id)
+        self.add_thing(unit)
+        self.get_fog_of_war(team).reveal(unit, x, y)
 
         return unit
 
+    def move_unit(self, unit, old_x, old_y):
+        """
+        Updates what every team can see after a unit moved from
+        (old_x, old_y)
+        """
+        self.grid.move(unit, old_x, old_y)
+        self.visibility.move_thing(unit, old_x, old_y)
+
+        fog = self.get_fog_of_war(unit.get_team())
+        fog.reveal(unit, unit.get_x(), unit.get_y())
+        fog.conceal(unit, old_x, old_y)
+
     def remove_unit(self, unit):
         del self.units[unit.get_id()]
-        del self.things[unit.get_id()]
         unit.get_team().remove_unit(unit)
-        self.game_map.set_square_at(x, y, constants.EMPTY)
+        self.game_map.set_square_at(unit.get_x(), unit.get_y(), constants.EMPTY)
+        self.get_fog_of_war(unit.get_team()).conceal(unit, unit.get_x(),
+            unit.get_y())
+        self.remove_thing(unit)
 
     def get_gold_mines(self):
         return self.gold_mines
 
+    def get_gold_mine_at(self, x, y):
+        """
+        Returns the gold mine at (x, y), or None if there is no gold mine there
+        """
+        thing = self.grid.get_at(x, y)
+        if thing is not None and thing.get_id() in self.gold_mines:
+            return thing
+        return None
+
     def create_gold_mine(self, x, y):
         id = self.generate_id()
         gold_mine = GoldMine(id, x, y, self)
         self.gold_mines[id] = gold_mine
-        self.things[id] = gold_mine
         self.game_map.set_square_at(x, y, constants.GOLD_MINE)
+        self.add_thing(gold_mine)
 
     def remove_gold_mine(self, gold_mine):
         del self.gold_mines[gold_mine.get_id()]
-        del self.things[gold_mine.get_id()]
+        self.remove_thing(gold_mine)
         self.game_map.set_square_at(gold_mine.get_x(), gold_mine.get_y(),
             constants.BLOCK)
 
     def get_trees(self):
         return self.trees
 
+    def get_tree_at(self, x, y):
+        """
+        Returns the tree at (x, y), or None if there is no tree there
+        """
+        thing = self.grid.get_at(x, y)
+        if thing is not None and thing.get_id() in self.trees:
+            return thing
+        return None
+
     def create_tree(self, x, y):
         id = self.generate_id()
         tree = Tree(id, x, y, self)
         self.trees[id] = tree
-        self.things[id] = tree
         self.game_map.set_square_at(x, y, constants.TREE)
+        self.add_thing(tree)
 
     def remove_tree(self, tree):
         del self.trees[tree.get_id()]
-        del self.things[tree.get_id()]
+        self.remove_thing(tree)
         self.game_map.set_square_at(tree.get_x(), tree.get_y(), constants.EMPTY)
 
     def remove_player(self, player):
         self.players.remove(player)
+        self.defeated_players.append(player)
 
     def get_first_turn_data(self, player):
         """
@@ -205,102 +476,359 @@ class Engine:
         data["starting_units"] = [unit.to_dict() for unit in starting_units]
         data["teams"] = list(self.teams.keys())
         data["team_id"] = player.get_team().get_id()
+        data["protocols"] = list(player.get_protocols())
 
+        if player.is_in_process():
+            # It gets the dictionary itself, so give it its own board
+            data["map"] = [list(row) for row in board]
+            return data
         return json.dumps(data)
 
 
+    def clip_region(self, region):
+        """
+        Returns a region (left, top, right, bottom) cut down to the map
+        """
+        left, top, right, bottom = region
+        width = self.game_map.get_width()
+        height = self.game_map.get_height()
+        left = min(max(left, 0), width)
+        top = min(max(top, 0), height)
+        return (left, top, min(max(right, left), width),
+            min(max(bottom, top), height))
+
+    def get_observed_things(self, player, fields=None):
+        """
+        Returns a dictionary from each of "units", "gold_mines" and "trees" in
+        fields, by default the ones the player asked for, to a list of the
+        things of that kind its team can see in its region
+        """
+        fog = self.get_fog_of_war(player.get_team())
+        region = player.get_region()
+        if fields is None:
+            fields = player.get_fields()
+        observed = {field: [] for field in fields if field != "map"}
+        for id, thing in fog.get_visible_things().items():
+            if id in self.units:
+                field = "units"
+            elif id in self.gold_mines:
+                field = "gold_mines"
+            else:
+                field = "trees"
+            if field not in observed:
+                continue
+            if region is not None:
+                left, top, right, bottom = region
+                if not (left <= thing.get_x() < right
+                        and top <= thing.get_y() < bottom):
+                    continue
+            observed[field].append(thing)
+        return observed
+
     def get_data(self, player):
         """
-        Get data to pass to a player
+        Get data to pass to a player.  Only the fields it asked for are sent,
+        for the squares in its region.
         """
-        team = player.get_team()
+        if player.is_in_process():
+            return self.get_native_data(player)
+        elif player.get_protocol() == constants.DELTA_PROTOCOL:
+            return self.get_delta_data(player)
+        elif player.get_protocol() in (constants.BINARY_PROTOCOL,
+                constants.SHARED_MEMORY_PROTOCOL):
+            return self.get_binary_data(player)
 
-        data = {}
-        board = self.game_map.get_visible_board(team)
-        visible_units = [
-            unit.to_dict() for unit in self.units.values()
-            if board[unit.y][unit.x] != constants.INVISIBLE
-        ]
-        visible_gold_mines = [
-            gold_mine.to_dict() for gold_mine in self.gold_mines.values()
-            if board[gold_mine.y][gold_mine.x] != constants.INVISIBLE
-        ]
-        visible_trees = [
-            tree.to_dict() for tree in self.trees.values()
-            if board[tree.y][tree.x] != constants.INVISIBLE
-        ]
+        team = player.get_team()
+        fog = self.get_fog_of_war(team)
+        region = player.get_region()
+
+        # Assemble the json from each thing's cached json rather than building
+        # and encoding the whole dictionary again for every player.
+        fields = [("time", json.dumps(player.get_time()))]
+        if "map" in player.get_fields():
+            fields.append(("map", fog.get_board_json(region)))
+            if region is not None:
+                fields.append(("origin", json.dumps(list(region[:2]))))
+        for field, things in self.get_observed_things(player).items():
+            fields.append((field,
+                "[" + ", ".join(thing.to_json() for thing in things) + "]"))
+        fields.append(("gold", json.dumps(team.get_gold())))
+        fields.append(("wood", json.dumps(team.get_wood())))
+
+        return "{" + ", ".join(
+            '"{}": {}'.format(field, value) for field, value in fields
+        ) + "}"
+
+    def get_native_data(self, player):
+        """
+        Get data to pass to a player running in our process.  It is the
+        dictionary get_data's json decodes to, with a board of its own.
+        """
+        team = player.get_team()
+        fog = self.get_fog_of_war(team)
+        region = player.get_region()
 
-        data["time"] = player.get_time()
-        data["map"] = board
-        data["units"] = visible_units
-        data["gold_mines"] = visible_gold_mines
-        data["trees"] = visible_trees
+        data = {"time": player.get_time()}
+        if "map" in player.get_fields():
+            if region is None:
+                data["map"] = [list(row) for row in fog.get_board()]
+            else:
+                left, top, right, bottom = region
+                data["map"] = [
+                    row[left:right] for row in fog.get_board()[top:bottom]
+                ]
+                data["origin"] = [left, top]
+        for field, things in self.get_observed_things(player).items():
+            data[field] = [thing.to_dict() for thing in things]
         data["gold"] = team.get_gold()
         data["wood"] = team.get_wood()
+        return data
 
-        return json.dumps(data)
-
-    def process_actions(self, action_string, team):
+    def get_delta_data(self, player):
+        """
+        Get data to pass to a player using delta observations.  Only the
+        squares and things that changed since its last turn are sent, along
+        with the ids of the things it can no longer see.  The squares are at
+        their places on the whole map, even when only those in the player's
+        region are sent, and the region's origin is sent as with get_data.
+        """
+        team = player.get_team()
+        fog = self.get_fog_of_war(team)
+        region = player.get_region()
+
+        fields = [("time", json.dumps(player.get_time()))]
+        if "map" in player.get_fields():
+            squares = fog.pop_changes()
+            if region is not None:
+                left, top, right, bottom = region
+                squares = [
+                    square for square in squares
+                    if left <= square[0] < right and top <= square[1] < bottom
+                ]
+                fields.append(("origin", json.dumps([left, top])))
+            fields.append(("squares", json.dumps(squares)))
+
+        sent = player.sent_things
+        visible = {}
+        for field, things in self.get_observed_things(player).items():
+            changed = []
+            for thing in things:
+                fragment = thing.to_json()
+                visible[thing.get_id()] = fragment
+                if sent.get(thing.get_id()) != fragment:
+                    changed.append(fragment)
+            fields.append((field, "[" + ", ".join(changed) + "]"))
+        removed = [id for id in sent if id not in visible]
+        player.sent_things = visible
+
+        fields.append(("removed", json.dumps(removed)))
+        fields.append(("gold", json.dumps(team.get_gold())))
+        fields.append(("wood", json.dumps(team.get_wood())))
+
+        return "{" + ", ".join(
+            '"{}": {}'.format(field, value) for field, value in fields
+        ) + "}"
+
+    def get_binary_data(self, player):
+        """
+        Get data to pass to a player using the binary protocol
+        """
+        team = player.get_team()
+        fog = self.get_fog_of_war(team)
+        region = player.get_region()
+
+        fields = player.get_fields()
+        rows = []
+        if "map" in fields:
+            rows = fog.get_board_rows(region)
+            # The board only marks where units are, and their records fill in
+            # their ids, so they are sent even if the player didn't ask for them
+            fields = tuple(fields) + ("units",)
+        observed = self.get_observed_things(player, fields)
+        return protocol.encode_observation(
+            player.get_time(),
+            team.get_gold(),
+            team.get_wood(),
+            rows,
+            [thing.to_record() for thing in observed.get("units", [])],
+            [thing.to_record() for thing in observed.get("gold_mines", [])],
+            [thing.to_record() for thing in observed.get("trees", [])],
+            (0, 0) if region is None else region[:2]
+        )
+
+    def legal_actions(self, unit_or_team):
+        """
+        Returns a list of every action a unit (or every unit on a team) could
+        legally take right now, in the format players send them in.  A give
+        action hands over all of the unit's gold and wood.
+        """
+        if isinstance(unit_or_team, Team):
+            actions = []
+            for unit in unit_or_team.get_units().values():
+                actions.extend(self.legal_actions(unit))
+            return actions
+
+        unit = unit_or_team
+        if unit.get_action_taken():
+            return []
+
+        unit_type = unit.get_unit_type()
+        team = unit.get_team()
+        id = unit.get_id()
+        x, y = unit.get_x(), unit.get_y()
+        actions = []
+
+        for dx, dy in unit_type.get_movement_stencil():
+            if (self.game_map.in_bounds(x + dx, y + dy) and
+                    self.game_map.get_square_at(x + dx, y + dy) == constants.EMPTY):
+                actions.append({"type": constants.MOVE, "unit": id,
+                    "x": x + dx, "y": y + dy})
+
+        for dx, dy in unit_type.get_attack_stencil():
+            if self.game_map.in_bounds(x + dx, y + dy):
+                actions.append({"type": constants.ATTACK, "unit": id,
+                    "x": x + dx, "y": y + dy})
+
+        buildable = [
+            other_type for other_type in constants.ALLOWED_CREATIONS[unit_type]
+            if team.get_gold() >= other_type.get_gold_cost()
+            and team.get_wood() >= other_type.get_wood_cost()
+        ]
+        has_resources = unit.get_gold() > 0 or unit.get_wood() > 0
+        for dx, dy in constants.NEIGHBOR_STENCIL:
+            if not self.game_map.in_bounds(x + dx, y + dy):
+                continue
+            square = self.game_map.get_square_at(x + dx, y + dy)
+            if square == constants.EMPTY:
+                for other_type in buildable:
+                    actions.append({"type": constants.BUILD, "unit": id,
+                        "unit_type": str(other_type), "x": x + dx, "y": y + dy})
+            elif square == constants.GOLD_MINE and unit_type == constants.PEASANT:
+                actions.append({"type": constants.MINE, "unit": id,
+                    "x": x + dx, "y": y + dy})
+            elif square == constants.TREE and unit_type == constants.PEASANT:
+                actions.append({"type": constants.CUT, "unit": id,
+                    "x": x + dx, "y": y + dy})
+            elif square in self.units and square != id and has_resources:
+                actions.append({"type": constants.GIVE, "unit": id,
+                    "other": square, "gold": unit.get_gold(),
+                    "wood": unit.get_wood()})
+
+        return actions
+
+    def process_actions(self, actions, team):
+        """
+        Process a list of actions.  They are all checked first, and those that
+        are malformed or control other teams' units are rejected without being
+        tried.
+        """
+        errors = [self.check_action(action, team) for action in actions]
+        for index, (action, error) in enumerate(zip(actions, errors)):
+            if error is None:
+                error = self.complete_action(action, team)
+            if error is not None:
+                self.reject_action(team, index, error)
+
+    def check_action(self, action, team):
         """
-        Process actions from a json string
+        Returns the code for why an action isn't in the format players send or
+        controls a unit that isn't the team's, or None if it is fine
         """
-        data = json.loads(action_string)
-        for action in data:
-            self.complete_action(action, team)
+        if action.__class__ is not dict:
+            return exceptions.MALFORMED
+        action_type = action.get("type")
+        if action_type.__class__ is not str:
+            return exceptions.MALFORMED
+        fields = ACTION_FIELDS.get(action_type)
+        if fields is None:
+            return exceptions.UNKNOWN_ACTION
+        for name, kind in fields:
+            if name not in action:
+                return exceptions.MALFORMED
+            if kind is not None and action[name].__class__ is not kind:
+                return exceptions.MALFORMED
+
+        if action_type != constants.LOG:
+            unit = self.units.get(action["unit"])
+            if unit is None:
+                return exceptions.UNKNOWN_UNIT
+            if unit.team != team:
+                return exceptions.NOT_YOUR_UNIT
+        if (action_type == constants.BUILD
+                and action["unit_type"] not in constants.UNIT_TYPES_BY_NAME):
+            return exceptions.UNKNOWN_UNIT_TYPE
+        if action_type == constants.GIVE and min(action["gold"], action["wood"]) < 0:
+            return exceptions.NEGATIVE_AMOUNT
+        return None
 
     def complete_action(self, action, team):
         """
-        Processes a single action
+        Carries out a single checked action, returning the code for why it
+        wasn't allowed, or None if it was done
         """
         try:
-            # Check to make sure they aren't trying to control someone else's
-            # units.
-            if action["type"] in (constants.ATTACK, constants.BUILD, constants.GIVE, constants.CUT, constants.MINE):
-                unit = self.units[action["unit"]]
-                if unit.team != team:
-                    raise InvalidAction("You can't control units that are not your own.")
-
-            # Process the action
-            if action["type"] == constants.ATTACK:
-                unit = self.units[action["unit"]]
+            if action["type"] != constants.LOG:
+                # The unit may have been killed by an earlier action
+                unit = self.units.get(action["unit"])
+                if unit is None:
+                    return exceptions.UNKNOWN_UNIT
+
+            if action["type"] == constants.MOVE:
+                unit.move(action["x"], action["y"])
+            elif action["type"] == constants.ATTACK:
                 unit.attack(action["x"], action["y"])
             elif action["type"] == constants.BUILD:
-                unit = self.units[action["unit"]]
-                id = unit.build(action["unit_type"], action["x"], action["y"])
+                unit_type = constants.UNIT_TYPES_BY_NAME[action["unit_type"]]
+                id = unit.build(unit_type, action["x"], action["y"])
                 action["other"] = id
             elif action["type"] == constants.GIVE:
-                unit = self.units[action["unit"]]
-                other = self.units[action["other"]]
+                other = self.units.get(action["other"])
+                if other is None:
+                    return exceptions.UNKNOWN_UNIT
                 unit.give(other, action["gold"], action["wood"])
             elif action["type"] == constants.CUT:
-                unit = self.units[action["unit"]]
                 unit.cut(action["x"], action["y"])
             elif action["type"] == constants.MINE:
-                unit = self.units[action["unit"]]
                 unit.mine(action["x"], action["y"])
             elif action["type"] == constants.LOG:
-                pass # Logs are dealt with later
-            else:
-                raise InvalidAction(action)
-        except Exception:
-            if not self.quiet:
-                traceback.print_exc()
-        # Save the action to our action log if it was valid, and print it out
-        else:
-            short = self.short_version(action)
-            if action["type"] != constants.LOG:
-                # Don't save logs, because who cares about those?
-                self.save_action(short)
-            if not self.quiet:
-                print(*short)
+                self.log.player_message(team.get_id(), self.turn,
+                    str(action["message"]))
+                return None
+        except InvalidAction as e:
+            return e.get_code()
+
+        # Save the action to our action log, and log it
+        short = self.short_version(action)
+        self.save_action(short)
+        self.log.action(short)
+        return None
 
+    def reject_action(self, team, index, code):
+        """
+        Records that the index-th of the actions a team sent this turn was
+        rejected
+        """
+        error = (team.get_id(), self.turn, index, code)
+        self.action_errors.append(error)
+        counts = self.error_counts.setdefault(team.get_id(), {})
+        counts[code] = counts.get(code, 0) + 1
+        if self.print_errors:
+            self.log.rejection(error)
+
+    def get_action_errors(self):
+        return self.action_errors
+
+    def get_log(self):
+        return self.log
 
     def short_version(self, action):
         """
         Create a shorter version of an action, useful for saving it in a file
         without taking up a lot of room
         """
-        if action["type"] == constants.ATTACK:
+        if action["type"] == constants.MOVE:
+            return (constants.MOVE, action["unit"], action["x"], action["y"])
+        elif action["type"] == constants.ATTACK:
             return (constants.ATTACK, action["unit"], action["x"], action["y"])
         elif action["type"] == constants.BUILD:
             return (constants.BUILD, action["unit"], action["unit_type"], action["other"], action["x"], action["y"])
@@ -315,17 +843,32 @@ class Engine:
         return None
 
     def save_action(self, action):
-        self.game_data["turns"][-1].append(action)
+        if not self.headless:
+            self.game_data["turns"][-1].append(action)
 
     def clean_up(self):
         self.finished = True
-        for player in self.players:
-            player.clean_up(self.game_data["winner"])
+        players = self.players + self.defeated_players
+        winner = self.game_data["winner"]
+        if self.pool is not None:
+            self.run_all(self.pool.release(player, winner) for player in players)
+        else:
+            self.run_all(player.clean_up(winner) for player in players)
+            self.loop.close()
+        for player in players:
+            player_data = self.game_data["players"][player.get_team().get_id() - 1]
+            player_data["timeouts"] = player.get_timeouts()
+            player_data["cpu_time"] = round(player.get_cpu_time_used(), 3)
+            player_data["cpu_overruns"] = player.get_cpu_overruns()
+            player_data["protocol_errors"] = player.get_protocol_errors()
+            player_data["action_errors"] = self.error_counts.get(
+                player.get_team().get_id(), {})
 
         self.save()
+        self.log.close()
 
     def save(self):
-        print("Saving...")
+        self.log.info("Saving...")
         with open(os.path.join(my_dir, os.pardir, "saves", self.save_file), 'w') as f:
             f.write(json.dumps(self.game_data))
-        print("Done!")
+        self.log.info("Done!")
@@ -0,0 +1,228 @@
+#!/usr/bin/env python3
+import json
+from array import array
+
+from warcode import constants
+
+# The kinds of things kept in an entity store
+UNIT = 0
+TREE = 1
+GOLD_MINE = 2
+
+
+class EntityStore:
+    """
+    Holds the state of every unit, tree and gold mine in a game in parallel
+    typed arrays.  Unit, Tree and GoldMine are thin views onto one slot of the
+    store.  Slots of things that were removed are kept on a free list and
+    reused.
+
+    The json and binary record of each thing are cached in fragments and
+    records and cleared whenever one of its fields is written, so a thing that
+    didn't change isn't serialized again, whichever player it is sent to.
+    """
+    def __init__(self, engine):
+        self.engine = engine
+        self.teams = {}
+
+        self.ids = array("I")
+        self.kinds = array("B")
+        self.xs = array("i")
+        self.ys = array("i")
+        self.healths = array("i")
+        self.golds = array("i")
+        self.woods = array("i")
+        self.unit_types = array("B")
+        self.team_ids = array("B")
+        self.action_turns = array("I")
+        self.alive = array("B")
+        self.fragments = []
+        self.records = []
+
+        self.free = []
+
+        # A unit has taken an action this turn if its action turn equals its
+        # team's turn, so resetting a whole team only bumps one counter.
+        self.team_turns = {}
+
+    def copy(self, engine, teams):
+        """
+        Returns a copy of the store for another engine, whose units belong to
+        the given dictionary of teams
+        """
+        store = EntityStore(engine)
+        store.teams = dict(teams)
+        store.team_turns = dict(self.team_turns)
+        for name in ("ids", "kinds", "xs", "ys", "healths", "golds", "woods",
+                "unit_types", "team_ids", "action_turns", "alive"):
+            setattr(store, name, getattr(self, name)[:])
+        store.fragments = list(self.fragments)
+        store.records = list(self.records)
+        store.free = list(self.free)
+        return store
+
+    def add_team(self, team):
+        """
+        Registers a team so units can refer to it by id
+        """
+        self.teams[team.get_id()] = team
+        self.team_turns[team.get_id()] = 1
+
+    def allocate(self, id, kind, x, y):
+        """
+        Takes a free slot (or makes a new one) for a thing, returning its index
+        """
+        if self.free:
+            index = self.free.pop()
+            self.ids[index] = id
+            self.kinds[index] = kind
+            self.xs[index] = x
+            self.ys[index] = y
+            self.healths[index] = 0
+            self.golds[index] = 0
+            self.woods[index] = 0
+            self.unit_types[index] = 0
+            self.team_ids[index] = 0
+            self.action_turns[index] = 0
+            self.alive[index] = 1
+            self.fragments[index] = None
+            self.records[index] = None
+            return index
+
+        self.ids.append(id)
+        self.kinds.append(kind)
+        self.xs.append(x)
+        self.ys.append(y)
+        self.healths.append(0)
+        self.golds.append(0)
+        self.woods.append(0)
+        self.unit_types.append(0)
+        self.team_ids.append(0)
+        self.action_turns.append(0)
+        self.alive.append(1)
+        self.fragments.append(None)
+        self.records.append(None)
+        return len(self.ids) - 1
+
+    def allocate_unit(self, id, x, y, unit_type, team):
+        """
+        Takes a slot for a new unit, returning its index
+        """
+        index = self.allocate(id, UNIT, x, y)
+        self.healths[index] = unit_type.get_initial_health()
+        self.unit_types[index] = constants.UNIT_TYPES.index(unit_type)
+        self.team_ids[index] = team.get_id()
+        # Units can't take an action their first turn
+        self.action_turns[index] = self.team_turns[team.get_id()]
+        return index
+
+    def allocate_tree(self, id, x, y):
+        """
+        Takes a slot for a new tree, returning its index
+        """
+        index = self.allocate(id, TREE, x, y)
+        self.woods[index] = constants.TREE_HEALTH
+        return index
+
+    def allocate_gold_mine(self, id, x, y):
+        """
+        Takes a slot for a new gold mine, returning its index
+        """
+        index = self.allocate(id, GOLD_MINE, x, y)
+        self.golds[index] = constants.GOLD_MINE_HEALTH
+        return index
+
+    def release(self, index):
+        """
+        Frees the slot of a thing that was removed from the game
+        """
+        self.alive[index] = 0
+        self.free.append(index)
+
+    def reset_actions(self, team):
+        """
+        Lets every unit on a team take an action again
+        """
+        self.team_turns[team.get_id()] += 1
+
+    def get_action_taken(self, index):
+        """
+        Returns whether the unit in a slot has taken an action this turn
+        """
+        return self.action_turns[index] == self.team_turns[self.team_ids[index]]
+
+    def set_action_taken(self, index, boolean):
+        """
+        Sets whether the unit in a slot has taken an action this turn
+        """
+        turn = self.team_turns[self.team_ids[index]]
+        self.action_turns[index] = turn if boolean else turn - 1
+
+    def __len__(self):
+        """
+        Returns the number of things in the store
+        """
+        return len(self.ids) - len(self.free)
+
+
+def field(name):
+    """
+    Makes a property reading and writing one of the store's arrays at the
+    view's index
+    """
+    def get(self):
+        return getattr(self.store, name)[self.index]
+
+    def set(self, value):
+        getattr(self.store, name)[self.index] = value
+        self.store.fragments[self.index] = None
+        self.store.records[self.index] = None
+
+    return property(get, set)
+
+
+class EntityView:
+    """
+    Base class of the views onto an entity store
+    """
+    __slots__ = ("store", "index")
+
+    id = field("ids")
+    x = field("xs")
+    y = field("ys")
+
+    @classmethod
+    def view(cls, store, index):
+        """
+        Makes a view of an existing slot of a store
+        """
+        view = cls.__new__(cls)
+        view.store = store
+        view.index = index
+        return view
+
+    @property
+    def engine(self):
+        return self.store.engine
+
+    def to_json(self):
+        """
+        Returns our dictionary encoded as json, reusing the cached encoding if
+        nothing changed since it was made
+        """
+        fragment = self.store.fragments[self.index]
+        if fragment is None:
+            fragment = json.dumps(self.to_dict())
+            self.store.fragments[self.index] = fragment
+        return fragment
+
+    def to_record(self):
+        """
+        Returns our record for the binary protocol, reusing the cached record
+        if nothing changed since it was made
+        """
+        record = self.store.records[self.index]
+        if record is None:
+            record = self.pack_record()
+            self.store.records[self.index] = record
+        return record
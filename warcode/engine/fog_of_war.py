@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+import json
+
+from warcode import constants, protocol
+
+class FogOfWar:
+    """
+    What a team can see of the map.  Keeps a count of how many of the team's
+    units can see each square, updated as units are created, moved and
+    removed, so the visible board is never rebuilt from scratch.  The team's
+    bit in the shared visibility masks is set wherever the count is positive.
+    """
+    def __init__(self, team, visibility):
+        self.team = team
+        self.bit = 1 << (team.get_id() - 1)
+        self.visibility = visibility
+        self.engine = visibility.engine
+        self.game_map = self.engine.get_game_map()
+
+        width = self.game_map.get_width()
+        height = self.game_map.get_height()
+        self.counts = [[0 for x in range(width)] for y in range(height)]
+        self.board = [
+            [constants.INVISIBLE for x in range(width)]
+            for y in range(height)
+        ]
+        self.visible_things = {}
+        # The json of each row of the board, or None if the row changed
+        self.row_fragments = [None for y in range(height)]
+        # The same for each row encoded for the binary protocol
+        self.row_bytes = [None for y in range(height)]
+        # The squares that changed since pop_changes was last called, if the
+        # team's player asked for delta observations
+        self.changes = None
+
+    def copy(self, team, visibility, things):
+        """
+        Returns a copy of the fog of war for another engine, given its copy of
+        our team, its visibility and its dictionary of things
+        """
+        fog = FogOfWar.__new__(FogOfWar)
+        fog.team = team
+        fog.bit = self.bit
+        fog.visibility = visibility
+        fog.engine = visibility.engine
+        fog.game_map = fog.engine.get_game_map()
+        fog.counts = [list(row) for row in self.counts]
+        fog.board = [list(row) for row in self.board]
+        fog.visible_things = {id: things[id] for id in self.visible_things}
+        fog.row_fragments = list(self.row_fragments)
+        fog.row_bytes = list(self.row_bytes)
+        fog.changes = None if self.changes is None else dict(self.changes)
+        return fog
+
+    def get_team(self):
+        """
+        Returns the team whose view this is
+        """
+        return self.team
+
+    def get_board(self):
+        """
+        Returns the board with every square the team can't see hidden
+        """
+        return self.board
+
+    def get_board_json(self, region=None):
+        """
+        Returns the board encoded as json, only encoding the rows that changed
+        since the last call.  If a region (left, top, right, bottom) is given,
+        only the squares in it are encoded.
+        """
+        if region is not None:
+            left, top, right, bottom = region
+            return "[" + ", ".join(
+                json.dumps(self.board[y][left:right]) for y in range(top, bottom)
+            ) + "]"
+
+        for y, fragment in enumerate(self.row_fragments):
+            if fragment is None:
+                self.row_fragments[y] = json.dumps(self.board[y])
+        return "[" + ", ".join(self.row_fragments) + "]"
+
+    def get_board_rows(self, region=None):
+        """
+        Returns a list of the rows of the board encoded for the binary
+        protocol, only encoding the rows that changed since the last call.  If
+        a region (left, top, right, bottom) is given, the rows are cut down to
+        it.
+        """
+        if region is None:
+            left, top, right, bottom = 0, 0, None, len(self.board)
+        else:
+            left, top, right, bottom = region
+        for y in range(top, bottom):
+            if self.row_bytes[y] is None:
+                self.row_bytes[y] = protocol.encode_row(self.board[y])
+        if region is None:
+            return self.row_bytes
+        return [row[left:right] for row in self.row_bytes[top:bottom]]
+
+    def set_square(self, x, y, value):
+        """
+        Changes a square on our board
+        """
+        self.board[y][x] = value
+        self.row_fragments[y] = None
+        self.row_bytes[y] = None
+        if self.changes is not None:
+            self.changes[(x, y)] = value
+
+    def track_changes(self):
+        """
+        Starts recording which squares change.  Every square we can already
+        see counts as changed, since the player hasn't been sent it yet.
+        """
+        self.changes = {}
+        for y, row in enumerate(self.board):
+            for x, value in enumerate(row):
+                if value != constants.INVISIBLE:
+                    self.changes[(x, y)] = value
+
+    def pop_changes(self):
+        """
+        Returns a list of [x, y, value] for every square that changed since
+        the last call
+        """
+        changes = [[x, y, value] for (x, y), value in self.changes.items()]
+        self.changes = {}
+        return changes
+
+    def get_visible_things(self):
+        """
+        Returns a dictionary of the units, trees and gold mines the team can
+        see
+        """
+        return self.visible_things
+
+    def is_visible(self, x, y):
+        """
+        Returns whether the team can see the square (x, y)
+        """
+        return self.counts[y][x] > 0
+
+    def squares_in_sight(self, unit, x, y):
+        """
+        Returns a generator of the squares on the map that unit could see from
+        (x, y)
+        """
+        width = self.game_map.get_width()
+        height = self.game_map.get_height()
+        for dx, dy in unit.get_unit_type().get_visibility_stencil():
+            if 0 <= x + dx < width and 0 <= y + dy < height:
+                yield (x + dx, y + dy)
+
+    def reveal(self, unit, x, y):
+        """
+        Adds the sight of a unit standing at (x, y)
+        """
+        for square_x, square_y in self.squares_in_sight(unit, x, y):
+            self.counts[square_y][square_x] += 1
+            if self.counts[square_y][square_x] == 1:
+                self.visibility.masks[square_y][square_x] |= self.bit
+                self.set_square(square_x, square_y,
+                    self.game_map.get_square_at(square_x, square_y))
+                thing = self.engine.get_thing_at(square_x, square_y)
+                if thing is not None:
+                    self.visible_things[thing.get_id()] = thing
+
+    def conceal(self, unit, x, y):
+        """
+        Removes the sight of a unit that was standing at (x, y)
+        """
+        for square_x, square_y in self.squares_in_sight(unit, x, y):
+            self.counts[square_y][square_x] -= 1
+            if self.counts[square_y][square_x] == 0:
+                self.visibility.masks[square_y][square_x] &= ~self.bit
+                self.set_square(square_x, square_y, constants.INVISIBLE)
+                thing = self.engine.get_thing_at(square_x, square_y)
+                if thing is not None:
+                    self.visible_things.pop(thing.get_id(), None)
@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+"""
+Logging for a game, built on the logging module.  Records are handed in
+batches through a queue to a background thread that writes them, so the game
+never waits on the terminal or a file.  The engine logs the actions it carries out at DEBUG and
+its progress at INFO, and each player's LOG actions are logged at DEBUG,
+cut down to a size.  The most recent records are kept in a ring buffer, and
+players' logs can be written to a file for each player.
+"""
+import collections
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+
+from warcode import constants
+
+
+class GameLogger(logging.Logger):
+    """
+    A logger that doesn't look up where each record was logged from
+    """
+    def findCaller(self, stack_info=False, stacklevel=1):
+        return "(unknown file)", 0, "(unknown function)", None
+
+
+class RingBufferHandler(logging.Handler):
+    """
+    Keeps the last capacity records in memory
+    """
+    def __init__(self, capacity):
+        super().__init__()
+        self.records = collections.deque(maxlen=capacity)
+
+    def emit(self, record):
+        self.records.append(record)
+
+    def get_records(self):
+        return list(self.records)
+
+
+class PlayerFileHandler(logging.Handler):
+    """
+    Writes each player's records to its own file, named after the game and the
+    player's team, opening the files as they are needed
+    """
+    def __init__(self, log_dir, game_name):
+        super().__init__()
+        self.log_dir = log_dir
+        self.game_name = game_name
+        self.files = {}
+        self.setFormatter(logging.Formatter("%(turn)s %(message)s"))
+
+    def emit(self, record):
+        team = getattr(record, "team", None)
+        if team is None:
+            return
+        if team not in self.files:
+            self.files[team] = open(os.path.join(self.log_dir,
+                "{}.team{}.log".format(self.game_name, team)), "w")
+        self.files[team].write(self.format(record) + "\n")
+
+    def close(self):
+        for f in self.files.values():
+            f.close()
+        self.files = {}
+        super().close()
+
+
+class RecordQueue(queue.Queue):
+    """
+    A queue of batches of records, whose size is the number of records in it
+    """
+    def _init(self, maxsize):
+        self.queue = collections.deque()
+        self.records = 0
+
+    def _qsize(self):
+        return self.records
+
+    def _put(self, batch):
+        self.queue.append(batch)
+        self.records += len(batch) if batch is not None else 1
+
+    def _get(self):
+        batch = self.queue.popleft()
+        self.records -= len(batch) if batch is not None else 1
+        return batch
+
+
+class BatchQueueHandler(logging.handlers.QueueHandler):
+    """
+    Hands records to a bounded queue in lists of up to BATCH_SIZE, dropping
+    them instead of waiting when the writer has fallen behind.  Flush it to
+    hand over a batch that isn't full.
+    """
+    BATCH_SIZE = 256
+
+    def __init__(self, batches):
+        super().__init__(batches)
+        self.batch = []
+        self.dropped = 0
+
+    def prepare(self, record):
+        """
+        Merges the record's arguments into its message.  Unlike QueueHandler,
+        the record isn't copied, since nothing else sees it.
+        """
+        record.msg = record.message = record.getMessage()
+        record.args = None
+        record.exc_info = None
+        record.exc_text = None
+        return record
+
+    def emit(self, record):
+        self.batch.append(self.prepare(record))
+        if len(self.batch) >= self.BATCH_SIZE:
+            self.flush()
+
+    def flush(self):
+        if not self.batch:
+            return
+        try:
+            self.queue.put_nowait(self.batch)
+        except queue.Full:
+            self.dropped += len(self.batch)
+        self.batch = []
+
+
+class BatchQueueListener(logging.handlers.QueueListener):
+    """
+    Passes each record in the batches from a BatchQueueHandler to its handlers
+    """
+    def handle(self, batch):
+        for record in batch:
+            super().handle(record)
+
+    def enqueue_sentinel(self):
+        # Wait for room, since the queue may be full
+        self.queue.put(self._sentinel)
+
+
+class GameLog:
+    """
+    The engine's and players' loggers for a game.  Records at INFO and above
+    are printed, and so are the rest unless the game is quiet.  Players' logs
+    are also written to files in log_dir if it is given.  A headless log, for
+    copies of a game, drops everything.  Close it when the game is over to
+    write out what is left.
+    """
+    def __init__(self, quiet=False, log_dir=None, game_name="game",
+            headless=False):
+        self.engine_logger = GameLogger("warcode.engine")
+        self.player_logger = GameLogger("warcode.players")
+        self.listener = None
+        self.ring_buffer = RingBufferHandler(constants.LOG_BUFFER_SIZE)
+        # How many characters each team has logged
+        self.sizes = {}
+        if headless:
+            self.engine_logger.disabled = True
+            self.player_logger.disabled = True
+            return
+
+        self.engine_logger.setLevel(logging.INFO if quiet else logging.DEBUG)
+        self.player_logger.setLevel(logging.DEBUG)
+        console = logging.StreamHandler(sys.stdout)
+        console.setLevel(logging.INFO if quiet else logging.DEBUG)
+        handlers = [self.ring_buffer, console]
+        if log_dir is not None:
+            handlers.append(PlayerFileHandler(log_dir, game_name))
+        self.handler = BatchQueueHandler(RecordQueue(constants.LOG_QUEUE_SIZE))
+        self.engine_logger.addHandler(self.handler)
+        self.player_logger.addHandler(self.handler)
+        self.listener = BatchQueueListener(self.handler.queue, *handlers,
+            respect_handler_level=True)
+        self.listener.start()
+
+    def get_records(self):
+        """
+        Returns the most recent records
+        """
+        return self.ring_buffer.get_records()
+
+    def flush(self):
+        """
+        Hands the records logged so far to the writer
+        """
+        if self.listener is not None:
+            self.handler.flush()
+
+    def info(self, message):
+        self.engine_logger.info(message)
+
+    def action(self, short):
+        """
+        Logs the short version of an action that was carried out
+        """
+        if self.engine_logger.isEnabledFor(logging.DEBUG):
+            self.engine_logger.debug(" ".join(str(part) for part in short))
+
+    def rejection(self, error):
+        """
+        Logs the record of a rejected action
+        """
+        self.engine_logger.info("%s %s %s %s", *error)
+
+    def player_message(self, team, turn, message):
+        """
+        Logs a message from a team's LOG action.  Messages are cut short, and
+        once a team has logged LOG_SIZE characters in a game the rest are
+        dropped.
+        """
+        if not self.player_logger.isEnabledFor(logging.DEBUG):
+            return
+        message = message[:constants.LOG_MESSAGE_SIZE]
+        size = self.sizes.get(team, 0) + len(message)
+        if size > constants.LOG_SIZE:
+            return
+        self.sizes[team] = size
+        self.player_logger.debug(message, extra={"team": team, "turn": turn})
+
+    def close(self):
+        """
+        Writes out every record still waiting and closes the files
+        """
+        if self.listener is None:
+            return
+        self.handler.flush()
+        self.listener.stop()
+        for handler in self.listener.handlers:
+            handler.close()
+        self.listener = None
@@ -19,6 +19,11 @@ class Map:
         self.height = map_data["height"]
         self.board = map_data["board"]
 
+        self.listeners = []
+        # Rows of the board we may change in place.  Copies of a map share
+        # their rows until one of them writes to a row.
+        self.owned_rows = set(range(self.height))
+
     def get_name(self):
         return self.name
 
@@ -37,11 +42,42 @@ class Map:
     def get_board(self):
         return self.board
 
+    def in_bounds(self, x, y):
+        """
+        Returns whether (x, y) is a square on the board
+        """
+        return 0 <= x < self.width and 0 <= y < self.height
+
     def get_square_at(self, x, y):
         return self.board[y][x]
 
     def set_square_at(self, x, y, value):
+        if y not in self.owned_rows:
+            self.board[y] = list(self.board[y])
+            self.owned_rows.add(y)
         self.board[y][x] = value
+        for listener in self.listeners:
+            listener(x, y, value)
+
+    def copy(self):
+        """
+        Returns a copy of the map, without any listeners.  The rows of the
+        board are shared and only copied when either map changes them.
+        """
+        game_map = Map.__new__(type(self))
+        game_map.__dict__.update(self.__dict__)
+        game_map.board = list(self.board)
+        game_map.listeners = []
+        game_map.owned_rows = set()
+        self.owned_rows = set()
+        return game_map
+
+    def add_listener(self, listener):
+        """
+        Adds a function to be called with (x, y, value) whenever a square on
+        the board changes
+        """
+        self.listeners.append(listener)
 
     def get_gold_mine_locations(self):
         """
@@ -60,22 +96,3 @@ class Map:
             for x, value in enumerate(row):
                 if value == constants.TREE:
                     yield (x, y)
-
-    def get_visible_board(self, team):
-        """
-        Returns our board but only the visible squares for the team
-        """
-        board = [
-            [constants.INVISIBLE for x in range(len(self.board[0]))]
-            for y in range(len(self.board))
-        ]
-
-        for y, row in enumerate(board):
-            for x, value in enumerate(row):
-                if any(
-                    unit.distance_to(x, y) <= unit.unit_type.visibility_distance
-                    for unit in team.units.values()
-                ):
-                    board[y][x] = value
-
-        return board
@@ -1,16 +1,18 @@
 #!/usr/bin/env python3
-from warcode import constants
+from warcode import protocol
+from warcode.engine.entity_store import EntityView, field
 
-class GoldMine:
+class GoldMine(EntityView):
     """
-    A gold mine.
+    A gold mine.  Its state is kept in the engine's entity store.
     """
+    __slots__ = ()
+
+    gold = field("golds")
+
     def __init__(self, id, x, y, engine):
-        self.id = id
-        self.x = x
-        self.y = y
-        self.engine = engine
-        self.gold = constants.GOLD_MINE_HEALTH
+        self.store = engine.get_entity_store()
+        self.index = self.store.allocate_gold_mine(id, x, y)
 
     def get_id(self):
         """
@@ -64,3 +66,8 @@ class GoldMine:
             "x": self.get_x(),
             "y": self.get_y()
         }
+
+    def pack_record(self):
+        store, index = self.store, self.index
+        return protocol.GOLD_MINE_RECORD.pack(store.ids[index], store.xs[index],
+            store.ys[index], store.golds[index])
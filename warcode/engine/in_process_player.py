@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+import io
+import os
+import runpy
+import sys
+import time
+
+from warcode import constants
+from warcode.engine import Player
+from warcode_starter.player import Player as StarterPlayer
+
+
+class InProcessPlayer(Player):
+    """
+    A player built on warcode_starter that is run inside the engine's process.
+    Its turns are handed to it as dictionaries rather than over pipes, but it
+    sees and answers exactly what it would as its own process, using the full
+    protocol.  It can't be interrupted, so a turn that runs over its time is
+    thrown away.  Its CPU time is the time the engine's thread spends in it.
+    """
+    protocols = (constants.FULL_PROTOCOL,)
+    in_process = True
+
+    async def start(self):
+        """
+        Runs the player's file, which makes the starter kit player we call.
+        It is run as it would be on its own, with its directory first on the
+        path, but with nothing on stdin, so a player that reads stdin itself
+        fails instead of reading ours.  The modules it imports from its
+        directory are forgotten afterwards, so another player's modules of
+        the same name are imported for that player instead of reusing ours.
+        """
+        players = []
+        argv, stdin, path = sys.argv, sys.stdin, sys.path[:]
+        modules = set(sys.modules)
+        directory = os.path.realpath(os.path.dirname(self.player_file))
+        StarterPlayer._in_process = players.append
+        sys.argv, sys.stdin = [self.player_file], io.StringIO()
+        sys.path.insert(0, directory)
+        try:
+            runpy.run_path(self.player_file, run_name="__main__")
+        except EOFError:
+            pass
+        finally:
+            StarterPlayer._in_process = None
+            sys.argv, sys.stdin = argv, stdin
+            sys.path[:] = path
+            for name in set(sys.modules) - modules:
+                module_file = getattr(sys.modules[name], "__file__", None)
+                if module_file is not None and os.path.realpath(
+                        module_file).startswith(directory + os.sep):
+                    del sys.modules[name]
+        if not players:
+            raise ValueError("{} didn't make a warcode_starter player.".format(
+                self.player_file))
+        self.player = players[0]
+
+    async def first_turn(self, data):
+        """
+        Pass data to player and complete the first turn
+        """
+        start = time.perf_counter()
+        cpu_start = time.thread_time()
+        reply = self.player._start(data)
+        self.cpu_time_used += time.thread_time() - cpu_start
+        if time.perf_counter() - start > constants.FIRST_TURN_TIME:
+            self.timeouts += 1
+            reply = ""
+        self.read_reply(reply)
+
+    async def turn(self, data):
+        """
+        Pass data to player and return its list of actions for a turn, or no
+        actions if it ran out of time or CPU time
+        """
+        start = time.perf_counter()
+        cpu_start = time.thread_time()
+        actions = self.player._play(data)
+        used = time.thread_time() - cpu_start
+        elapsed = time.perf_counter() - start
+        if elapsed > self.time:
+            self.timeouts += 1
+            actions = []
+        self.spend_time(elapsed)
+        if not self.spend_cpu_time(used):
+            actions = []
+        return actions
+
+    async def clean_up(self, winner):
+        """
+        Clean up at the end of the game
+        """
+        self.player = None
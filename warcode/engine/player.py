@@ -1,27 +1,137 @@
 #!/usr/bin/env python3
+import asyncio
+import json
 import random
+from multiprocessing import shared_memory
 from subprocess import PIPE
-from psutil import Popen
+import psutil
 import os
 import time
 
+from warcode import constants, protocol
+
 my_dir = os.path.realpath(os.path.dirname(__file__))
 
+# Seconds to wait for a killed player's process to exit
+KILL_TIME = 1.0
+
 
-def open_script(player_file):
+async def open_script(player_file):
     """
-    Runs a player file.  Returns the process of the player file script.
+    Runs a player file.  Returns the asyncio process of the player file script.
     """
 
-    return Popen(["python", player_file], stdin=PIPE, stdout=PIPE)
+    return await asyncio.create_subprocess_exec("python", player_file,
+        stdin=PIPE, stdout=PIPE)
 
 
 class Player:
-    def __init__(self, player_name):
-        player_file = os.path.join(my_dir, os.pardir, "players", player_name)
-        self.process = open_script(player_file)
-        self.process.suspend()
-        self.time = 1
+    """
+    A player's process, which the engine talks to over asyncio streams.  Each
+    turn the player has its time (reported in the time field of the
+    observation) to answer, or it is given no actions for the turn.  Time it
+    doesn't use is saved in a bank for later turns.  The CPU time its process
+    uses is measured too, and a turn that uses more than its CPU time is
+    thrown away.  Replies that are too long, aren't json or don't answer a
+    turn count as protocol errors and are thrown away too.
+
+    The process is normally suspended between its turns.  A cooperative
+    player's process is left running instead, blocking on its stdin until its
+    next turn (or thinking in the background), and any CPU time it uses
+    between turns is taken from its next turn.  This saves two signals per
+    turn.
+    """
+    # The protocols the player may pick from, and whether it is run inside the
+    # engine's process
+    protocols = constants.PROTOCOLS
+    in_process = False
+
+    def __init__(self, player_name, spawner=None, cooperative=False):
+        self.player_name = player_name
+        # Forks the player's process if given, rather than running python
+        self.spawner = spawner
+        self.cooperative = cooperative
+        self.player_file = os.path.join(my_dir, os.pardir, "players",
+            player_name)
+        self.process = None
+        self.reset()
+
+    def reset(self):
+        """
+        Forgets everything about the last game the player was in
+        """
+        self.name = self.player_name
+        self.time = constants.TIME_PER_TURN + constants.TIME_BANK
+        self.timeouts = 0
+        # CPU seconds the player may use this turn, how many it has used this
+        # game, and how many turns it used too many on
+        self.cpu_time = constants.CPU_TIME_PER_TURN + constants.CPU_TIME_BANK
+        self.cpu_time_used = 0
+        self.cpu_overruns = 0
+        self.protocol = constants.FULL_PROTOCOL
+        # The parts of each observation the player wants, and the squares
+        # (left, top, right, bottom) it wants them for, or None for all of them
+        self.fields = constants.OBSERVATION_FIELDS
+        self.region = None
+        # The json of each thing last sent to a player using delta
+        # observations
+        self.sent_things = {}
+        # The segment observations are written to for the shared memory
+        # protocol, and the number of turns sent through it
+        self.shared_memory = None
+        self.turns_sent = 0
+        # Replies read from the player, how many of them are answers to turns
+        # that already ran out of time, and how many turns haven't been
+        # answered yet
+        self.replies = None
+        self.reader = None
+        self.stale_replies = 0
+        self.expected_replies = 0
+        self.protocol_errors = 0
+
+    async def start(self):
+        """
+        Starts the player's process, leaving it suspended until its first turn
+        """
+        if self.spawner is not None:
+            self.process = await self.spawner.spawn(self.player_file)
+        else:
+            self.process = await open_script(self.player_file)
+        self.ps_process = psutil.Process(self.process.pid)
+        self.suspend()
+        self.output = protocol.MessageReader(self.process.stdout,
+            constants.MAX_MESSAGE_SIZE)
+        self.cpu_reading = 0
+        self.read_cpu_time()
+
+    def suspend(self):
+        if self.cooperative:
+            return
+        try:
+            self.ps_process.suspend()
+        except psutil.NoSuchProcess:
+            pass
+
+    def resume(self):
+        if self.cooperative:
+            return
+        try:
+            self.ps_process.resume()
+        except psutil.NoSuchProcess:
+            pass
+
+    def read_cpu_time(self):
+        """
+        Returns the user and system CPU time used by the player's process and
+        its children, or what they had used when last read if it has exited
+        """
+        try:
+            times = self.ps_process.cpu_times()
+            self.cpu_reading = (times.user + times.system
+                + times.children_user + times.children_system)
+        except psutil.NoSuchProcess:
+            pass
+        return self.cpu_reading
 
     def set_team(self, team):
         self.team = team
@@ -32,53 +142,444 @@ class Player:
     def get_time(self):
         return self.time
 
+    def get_timeouts(self):
+        return self.timeouts
+
+    def get_cpu_time(self):
+        return self.cpu_time
+
+    def get_cpu_time_used(self):
+        return self.cpu_time_used
+
+    def get_cpu_overruns(self):
+        return self.cpu_overruns
+
+    def get_protocol_errors(self):
+        return self.protocol_errors
+
     def get_name(self):
         return self.name
 
-    def first_turn(self, data):
+    def get_protocol(self):
+        return self.protocol
+
+    def get_protocols(self):
+        return self.protocols
+
+    def is_in_process(self):
+        return self.in_process
+
+    def get_fields(self):
+        return self.fields
+
+    def get_region(self):
+        return self.region
+
+    def set_region(self, region):
+        self.region = region
+
+    async def send(self, message):
+        """
+        Writes a message to the player's stdin
+        """
+        self.process.stdin.write(message)
+        await self.process.stdin.drain()
+
+    async def first_exchange(self, data):
+        """
+        Sends the first turn's data to the player and returns the line it
+        answers with and whether it was cut short, or None if it closes its
+        stdout first
+        """
+        await self.send((data + "\n").encode('utf-8'))
+        return await self.output.read_line()
+
+    async def first_turn(self, data):
         """
         Pass data to player and complete the first turn
         """
-        self.process.resume()
-        self.process.stdin.write((data + "\n").encode('utf-8'))
-        self.process.stdin.flush()
-        self.name = self.process.stdout.readline().strip()
-        self.process.suspend()
+        cpu_start = self.cpu_reading
+        self.resume()
+        try:
+            # Sending counts toward the time too, since a player that doesn't
+            # read its stdin would keep a big first turn from being sent
+            message = await asyncio.wait_for(self.first_exchange(data),
+                constants.FIRST_TURN_TIME)
+            reply = ""
+            if message is not None:
+                line, truncated = message
+                if truncated:
+                    self.protocol_errors += 1
+                else:
+                    reply = line.decode('utf-8', 'replace').strip()
+        except asyncio.TimeoutError:
+            # Keep the file name and the full protocol, and ignore the reply
+            # when it comes.
+            reply = ""
+            self.timeouts += 1
+            self.stale_replies += 1
+            self.expected_replies += 1
+        except ConnectionError:
+            reply = ""
+        self.suspend()
+        # The first turn has no CPU limit, but still counts toward the total
+        self.cpu_time_used += self.read_cpu_time() - cpu_start
+        self.read_reply(reply)
+
+        # Now that the protocol is known, read the rest of the replies in the
+        # background.
+        self.replies = asyncio.Queue()
+        self.reader = asyncio.ensure_future(self.read_replies())
 
-    def turn(self, data):
+    def read_reply(self, reply):
         """
-        Pass data to player and return its actions for a turn
+        Reads the player's reply to its first turn
         """
-        # TODO:  Implement timing
-        self.reset()
-        self.process.resume()
-        self.process.stdin.write((data + "\n").encode('utf-8'))
-        self.process.stdin.flush()
-        actions = self.process.stdout.readline().strip()
-        self.process.suspend()
+        # Players either reply with just their name or with a json object
+        # holding their name, the protocol they want to use and what they
+        # want to be sent.
+        if reply.startswith("{"):
+            try:
+                options = json.loads(reply)
+                self.name = options["name"]
+                if options.get("protocol") in self.protocols:
+                    self.protocol = options["protocol"]
+                if "fields" in options:
+                    self.fields = tuple(
+                        field for field in constants.OBSERVATION_FIELDS
+                        if field in options["fields"]
+                    )
+                if options.get("region") is not None:
+                    x, y, width, height = (int(n) for n in options["region"])
+                    self.region = (x, y, x + width, y + height)
+            except (ValueError, TypeError, KeyError):
+                self.protocol_errors += 1
+        elif reply:
+            self.name = reply
+
+    async def read_replies(self):
+        """
+        Reads each reply from the player into our queue, ending with None when
+        the player closes its stdout.  Replies that were cut short are replaced
+        by no actions, and ones that don't answer a turn are dropped, so the
+        queue never holds more than the turns waiting on an answer.  With the
+        binary protocol, a message that isn't actions or is too long ends the
+        replies too, since what follows it can't be trusted to be framed.
+        """
+        while True:
+            if self.protocol == constants.BINARY_PROTOCOL:
+                message = await self.output.read_frame()
+                if message is None:
+                    break
+                kind, reply = message
+                if kind != protocol.ACTIONS or reply is None:
+                    self.protocol_errors += 1
+                    break
+                truncated = False
+            else:
+                message = await self.output.read_line()
+                if message is None:
+                    break
+                reply, truncated = message
+                reply = reply.strip()
+            if self.expected_replies == 0:
+                self.protocol_errors += 1
+                continue
+            self.expected_replies -= 1
+            if truncated:
+                self.protocol_errors += 1
+                reply = b"[]"
+            self.replies.put_nowait(reply)
+        self.replies.put_nowait(None)
+
+    async def next_reply(self):
+        """
+        Waits for the reply to the current turn, skipping the ones to turns
+        that ran out of time.  Returns None if the player has stopped replying.
+        """
+        while True:
+            reply = await self.replies.get()
+            if reply is None:
+                # Leave it for the next turn too
+                self.replies.put_nowait(None)
+                return None
+            if self.stale_replies == 0:
+                return reply
+            self.stale_replies -= 1
+
+    async def exchange(self, data):
+        """
+        Sends a turn's data to the player and returns its reply
+        """
+        self.expected_replies += 1
+        if self.protocol == constants.BINARY_PROTOCOL:
+            await self.send(protocol.frame(protocol.OBSERVATION, data))
+        elif self.protocol == constants.SHARED_MEMORY_PROTOCOL:
+            header = self.write_shared_memory(data)
+            await self.send((header + "\n").encode('utf-8'))
+        else:
+            await self.send((data + "\n").encode('utf-8'))
+        return await self.next_reply()
+
+    async def turn(self, data):
+        """
+        Pass data to player and return its list of actions for a turn, or no
+        actions if it runs out of time or CPU time
+        """
+        # Once the player's process is gone there's no one to send turns to
+        if self.has_exited():
+            return []
+        # The CPU time was last read at the end of the player's last turn, so
+        # this also counts what it used between turns.
+        cpu_start = self.cpu_reading
+        self.resume()
+        start = time.perf_counter()
+        try:
+            actions = await asyncio.wait_for(self.exchange(data), self.time)
+        except asyncio.TimeoutError:
+            actions = None
+            self.timeouts += 1
+            self.stale_replies += 1
+        except ConnectionError:
+            actions = None
+        self.suspend()
+        self.spend_time(time.perf_counter() - start)
+        if not self.spend_cpu_time(self.read_cpu_time() - cpu_start):
+            actions = None
+        if actions is None:
+            return []
+        return self.read_actions(actions)
+
+    def read_actions(self, reply):
+        """
+        Returns the list of actions in a reply, or no actions if it isn't one
+        """
+        try:
+            actions = json.loads(reply)
+        except ValueError:
+            actions = None
+        if not isinstance(actions, list):
+            self.protocol_errors += 1
+            return []
         return actions
 
+    def spend_time(self, elapsed):
+        """
+        Takes the time a turn took from the player's time, saving what is left
+        in its bank and giving it its time for the next turn
+        """
+        bank = min(max(self.time - elapsed, 0), constants.TIME_BANK)
+        self.time = bank + constants.TIME_PER_TURN
+
+    def spend_cpu_time(self, used):
+        """
+        Takes the CPU time a turn used from the player's CPU time the same way,
+        returning whether it had enough
+        """
+        self.cpu_time_used += used
+        enough = used <= self.cpu_time
+        if not enough:
+            self.cpu_overruns += 1
+        bank = min(max(self.cpu_time - used, 0), constants.CPU_TIME_BANK)
+        self.cpu_time = bank + constants.CPU_TIME_PER_TURN
+        return enough
+
+    def write_shared_memory(self, data):
+        """
+        Writes an observation into our shared memory segment, making a bigger
+        one if it doesn't fit, and returns the json header telling the player
+        where to find it.  The segment is stamped with the turn once the
+        observation is written, so a player still reading an older turn sees
+        it has been written over.
+        """
+        size = protocol.SEGMENT_HEADER.size + len(data)
+        if self.shared_memory is None or self.shared_memory.size < size:
+            self.close_shared_memory()
+            self.shared_memory = shared_memory.SharedMemory(create=True,
+                size=max(2 * size, 4096))
+        buffer = self.shared_memory.buf
+        self.turns_sent += 1
+        protocol.SEGMENT_HEADER.pack_into(buffer, 0, 0)
+        buffer[protocol.SEGMENT_HEADER.size:size] = data
+        protocol.SEGMENT_HEADER.pack_into(buffer, 0, self.turns_sent)
+        return json.dumps({
+            "turn": self.turns_sent,
+            "name": self.shared_memory.name,
+            "size": len(data)
+        })
+
+    def close_shared_memory(self):
+        """
+        Frees our shared memory segment if we have one
+        """
+        if self.shared_memory is not None:
+            self.shared_memory.close()
+            self.shared_memory.unlink()
+            self.shared_memory = None
+
     def is_alive(self):
         return len(self.team.get_units()) > 0
 
-    def reset(self):
+    def has_exited(self):
+        """
+        Returns whether the player's process has exited, closed its stdin or
+        closed its stdout, or we've stopped reading its replies
+        """
+        return (self.process.returncode is not None
+            or self.process.stdin.is_closing()
+            or (self.reader is not None and self.reader.done()))
+
+    def is_reusable(self):
+        """
+        Returns whether the player's process can be used for another game: it
+        is still running and isn't behind on its replies
+        """
+        return not self.has_exited() and self.stale_replies == 0
+
+    async def exchange_reset(self):
+        """
+        Sends the player's process a RESET message and waits for it to answer
+        with one, returning False if it closes its stdout first
+        """
+        await self.send(b"RESET\n")
+        while True:
+            message = await self.output.read_line()
+            if message is None:
+                return False
+            if message[0].strip() == b"RESET":
+                return True
+
+    async def restart(self):
         """
-        Prepare ourself for our turn
+        Tells the player's process a new game is starting, returning whether
+        it answered in time.  The player is reset either way.
         """
-        for unit in self.team.get_units().values():
-            unit.reset()
+        self.reset()
+        self.resume()
+        try:
+            return await asyncio.wait_for(self.exchange_reset(),
+                constants.FIRST_TURN_TIME)
+        except (asyncio.TimeoutError, ConnectionError):
+            return False
+        finally:
+            self.suspend()
+
+    async def end_game(self, winner):
+        """
+        Tells the player who won and stops reading its replies
+        """
+        message = "{} won the game!".format(winner).encode('utf-8')
+        if self.protocol == constants.BINARY_PROTOCOL:
+            message = protocol.frame(protocol.END, message)
+        else:
+            message += b"\n"
+        self.resume()
+        # A player that stopped reading its stdin might never take the
+        # message.
+        if not self.has_exited():
+            try:
+                await asyncio.wait_for(self.send(message), 0.001)
+            except (asyncio.TimeoutError, ConnectionError):
+                pass
+        if self.reader is not None:
+            self.reader.cancel()
+            self.reader = None
+        self.close_shared_memory()
+
+    async def drain_output(self):
+        """
+        Reads and throws away the rest of the player's stdout.  An asyncio
+        process isn't done until its stdout ends, and a player that wrote a lot
+        after we stopped reading would otherwise never be.
+        """
+        while await self.process.stdout.read(protocol.MessageReader.CHUNK_SIZE):
+            pass
 
-    def clean_up(self, winner):
+    async def kill(self):
+        """
+        Kills the player's process, waiting up to KILL_TIME seconds for it to
+        exit
+        """
+        try:
+            self.process.kill()
+        except ProcessLookupError:
+            pass
+        try:
+            await asyncio.wait_for(
+                asyncio.gather(self.drain_output(), self.process.wait()),
+                KILL_TIME)
+        except asyncio.TimeoutError:
+            pass
+
+    async def clean_up(self, winner):
         """
         Clean up at the end of the game
         """
-        self.process.stdin.write("{} won the game!\n".format(winner).encode('utf-8'))
+        await self.end_game(winner)
         # Give them a millisecond to clean up their code.
-        time.sleep(0.001)
-        self.process.kill()
+        await asyncio.sleep(0.001)
+        await self.kill()
 
     def to_dict(self):
         return {
             "name": self.name,
             "team": self.team.get_id()
         }
+
+
+class PlayerPool:
+    """
+    Keeps players' processes running between games, so later games can reuse
+    them instead of starting new ones.  Pass the same pool to each Engine and
+    close it when done.  Processes are told a new game is starting with a
+    RESET message, which they answer with RESET.  New processes are forked
+    from the spawner if one is given, and are cooperative players if asked.
+    """
+    def __init__(self, spawner=None, cooperative=False):
+        self.spawner = spawner
+        self.cooperative = cooperative
+        # The processes belong to the event loop they were started on, so the
+        # engines use ours.
+        self.loop = asyncio.new_event_loop()
+        # Lists of the waiting players for each player file
+        self.idle = {}
+
+    def get_loop(self):
+        return self.loop
+
+    async def acquire(self, player_name):
+        """
+        Returns a player for a new game, reusing a waiting process if one
+        answers
+        """
+        idle = self.idle.get(player_name, [])
+        while idle:
+            player = idle.pop()
+            if await player.restart():
+                return player
+            await player.kill()
+        player = Player(player_name, self.spawner, self.cooperative)
+        await player.start()
+        return player
+
+    async def release(self, player, winner):
+        """
+        Ends a player's game, keeping its process for later if it can be reused
+        """
+        await player.end_game(winner)
+        if player.is_reusable():
+            self.idle.setdefault(player.player_name, []).append(player)
+        else:
+            await player.kill()
+
+    def close(self):
+        """
+        Kills every waiting process
+        """
+        players = [player for idle in self.idle.values() for player in idle]
+        self.idle = {}
+
+        async def kill_all():
+            await asyncio.gather(*(player.kill() for player in players))
+        self.loop.run_until_complete(kill_all())
+        self.loop.close()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+
+class SpatialGrid:
+    """
+    A uniform grid over the map used to find units, trees and gold mines by
+    position.  Each cell of the grid covers a cell_size by cell_size block of
+    squares, so a radius query only has to look at the cells near it.
+    """
+    def __init__(self, width, height, cell_size=8):
+        self.cell_size = cell_size
+        self.columns = (width + cell_size - 1) // cell_size
+        self.rows = (height + cell_size - 1) // cell_size
+        self.cells = [
+            [{} for column in range(self.columns)]
+            for row in range(self.rows)
+        ]
+        self.positions = {}
+
+    def copy(self, things):
+        """
+        Returns a copy of the grid holding the things with the same ids from a
+        dictionary of things
+        """
+        grid = SpatialGrid.__new__(SpatialGrid)
+        grid.cell_size = self.cell_size
+        grid.columns = self.columns
+        grid.rows = self.rows
+        grid.cells = [
+            [{id: things[id] for id in cell} for cell in row]
+            for row in self.cells
+        ]
+        grid.positions = {
+            position: things[thing.id]
+            for position, thing in self.positions.items()
+        }
+        return grid
+
+    def get_cell(self, x, y):
+        """
+        Returns the dictionary of things in the grid cell holding (x, y)
+        """
+        return self.cells[y // self.cell_size][x // self.cell_size]
+
+    def insert(self, thing):
+        """
+        Adds a thing at its current position
+        """
+        x, y = thing.get_x(), thing.get_y()
+        self.positions[(x, y)] = thing
+        self.get_cell(x, y)[thing.get_id()] = thing
+
+    def remove(self, thing):
+        """
+        Removes a thing from its current position
+        """
+        x, y = thing.get_x(), thing.get_y()
+        del self.positions[(x, y)]
+        del self.get_cell(x, y)[thing.get_id()]
+
+    def move(self, thing, old_x, old_y):
+        """
+        Updates the position of a thing that moved from (old_x, old_y)
+        """
+        x, y = thing.get_x(), thing.get_y()
+        del self.positions[(old_x, old_y)]
+        self.positions[(x, y)] = thing
+        old_cell = self.get_cell(old_x, old_y)
+        new_cell = self.get_cell(x, y)
+        if old_cell is not new_cell:
+            del old_cell[thing.get_id()]
+            new_cell[thing.get_id()] = thing
+
+    def get_at(self, x, y):
+        """
+        Returns the thing at (x, y), or None if there is nothing there
+        """
+        return self.positions.get((x, y))
+
+    def get_in_radius(self, x, y, distance):
+        """
+        Returns a list of the things whose distance squared to (x, y) is at
+        most distance
+        """
+        radius = int(distance ** 0.5)
+        first_row = max(0, (y - radius) // self.cell_size)
+        last_row = min(self.rows - 1, (y + radius) // self.cell_size)
+        first_column = max(0, (x - radius) // self.cell_size)
+        last_column = min(self.columns - 1, (x + radius) // self.cell_size)
+
+        things = []
+        for row in self.cells[first_row:last_row + 1]:
+            for cell in row[first_column:last_column + 1]:
+                for thing in cell.values():
+                    if thing.distance_to(x, y) <= distance:
+                        things.append(thing)
+        return things
@@ -0,0 +1,248 @@
+#!/usr/bin/env python3
+"""
+Starts players by forking them from a template process instead of running a
+new python for each one.  The template has already imported the modules
+players use, so each player skips the interpreter's start up and those
+imports.
+
+main runs the template: it is given the socket to the engine and the modules
+to import, and forks a child for each player file the engine sends along with
+the pipes for the child's stdin and stdout.  Its children are left unreaped
+until the engine asks for their exit status, so their pids can't be reused
+while the engine might still signal them.
+"""
+import asyncio
+import importlib
+import os
+import runpy
+import socket
+import subprocess
+import sys
+import threading
+import traceback
+
+import psutil
+
+my_dir = os.path.realpath(os.path.dirname(__file__))
+
+# Modules every template imports
+DEFAULT_MODULES = (
+    "json", "warcode", "warcode.constants", "warcode.protocol", "warcode_starter"
+)
+
+# What the template answers when asked to collect a child it no longer has
+ALREADY_REAPED = "ALREADY_REAPED"
+# The exit status given to a child whose real one was lost, as asyncio does
+UNKNOWN_STATUS = 255
+
+
+class ForkedProcess:
+    """
+    A player process forked by the template.  It has the parts of an asyncio
+    process the engine uses.
+    """
+    def __init__(self, spawner, pid, stdin, stdout):
+        self.spawner = spawner
+        self.pid = pid
+        self.stdin = stdin
+        self.stdout = stdout
+        self.ps_process = psutil.Process(pid)
+        # The exit status, once the template has collected it for us
+        self.returncode = None
+
+    def has_ended(self):
+        """
+        Returns whether the process has exited, leaving a zombie for the
+        template to collect
+        """
+        try:
+            return (not self.ps_process.is_running()
+                or self.ps_process.status() == psutil.STATUS_ZOMBIE)
+        except psutil.NoSuchProcess:
+            return True
+
+    def kill(self):
+        """
+        Kills the process.  Its pid is checked, so a process that has since
+        been given the pid isn't killed instead.
+        """
+        if self.returncode is not None:
+            raise ProcessLookupError(self.pid)
+        try:
+            self.ps_process.kill()
+        except psutil.NoSuchProcess:
+            raise ProcessLookupError(self.pid) from None
+
+    async def wait(self):
+        """
+        Waits for the process to exit, returning its exit status
+        """
+        while self.returncode is None:
+            if self.has_ended():
+                returncode = await self.spawner.collect(self.pid)
+                self.returncode = (UNKNOWN_STATUS if returncode is None
+                    else returncode)
+            else:
+                await asyncio.sleep(0.001)
+        self.stdin.close()
+        return self.returncode
+
+
+class Spawner:
+    """
+    Keeps a template process with modules already imported, and forks players
+    from it.  Close it when done.
+    """
+    def __init__(self, modules=()):
+        self.socket, template_socket = socket.socketpair()
+        root = os.path.join(my_dir, os.pardir, os.pardir)
+        env = dict(os.environ)
+        paths = [path for path in env.get("PYTHONPATH", "").split(os.pathsep)
+            if path]
+        env["PYTHONPATH"] = os.pathsep.join([root] + paths)
+        self.template = subprocess.Popen(
+            [sys.executable, "-c",
+                "from warcode.engine.spawner import main; main()",
+                str(template_socket.fileno())] + list(modules),
+            pass_fds=[template_socket.fileno()], stdin=subprocess.DEVNULL,
+            env=env)
+        template_socket.close()
+        self.replies = self.socket.makefile("r")
+        # Only one request may be waiting on the template at a time
+        self.lock = threading.Lock()
+
+    def request(self, message, fds=()):
+        """
+        Sends the template a message, along with file descriptors to pass on,
+        and returns its answer.  This blocks, so it is run on a worker thread.
+        """
+        with self.lock:
+            try:
+                socket.send_fds(self.socket, [(message + "\n").encode("utf-8")],
+                    fds)
+                reply = self.replies.readline()
+            except OSError as e:
+                raise RuntimeError("The spawner's template process has "
+                    "exited.") from e
+        if not reply:
+            raise RuntimeError("The spawner's template process has exited.")
+        return reply.strip()
+
+    def request_number(self, message, fds=()):
+        """
+        Sends the template a request answered with a number, returning it
+        """
+        return self.to_number(self.request(message, fds))
+
+    def to_number(self, reply):
+        """
+        Returns the number a reply from the template holds
+        """
+        try:
+            return int(reply)
+        except ValueError:
+            raise RuntimeError("The spawner's template process answered "
+                "{!r}.".format(reply)) from None
+
+    async def spawn(self, player_file):
+        """
+        Forks a process running a player file, returning it
+        """
+        loop = asyncio.get_running_loop()
+        stdin_read, stdin_write = os.pipe()
+        stdout_read, stdout_write = os.pipe()
+        try:
+            pid = await loop.run_in_executor(None, self.request_number,
+                "SPAWN " + player_file, [stdin_read, stdout_write])
+        except BaseException:
+            os.close(stdin_write)
+            os.close(stdout_read)
+            raise
+        finally:
+            os.close(stdin_read)
+            os.close(stdout_write)
+
+        stdout = asyncio.StreamReader(loop=loop)
+        await loop.connect_read_pipe(
+            lambda: asyncio.StreamReaderProtocol(stdout, loop=loop),
+            os.fdopen(stdout_read, "rb", 0))
+        # A writer needs a protocol that can pause writing; the reader it is
+        # given is never fed, as nothing is read from stdin
+        transport, stream_protocol = await loop.connect_write_pipe(
+            lambda: asyncio.StreamReaderProtocol(asyncio.StreamReader(
+                loop=loop), loop=loop),
+            os.fdopen(stdin_write, "wb", 0))
+        stdin = asyncio.StreamWriter(transport, stream_protocol, None, loop)
+        return ForkedProcess(self, pid, stdin, stdout)
+
+    async def collect(self, pid):
+        """
+        Has the template collect an exited child, returning its exit status
+        the way asyncio processes report it, or None if the child was already
+        collected and its exit status is lost
+        """
+        loop = asyncio.get_running_loop()
+        reply = await loop.run_in_executor(None, self.request,
+            "WAIT {}".format(pid))
+        if reply == ALREADY_REAPED:
+            return None
+        return self.to_number(reply)
+
+    def close(self):
+        """
+        Stops the template process
+        """
+        self.replies.close()
+        self.socket.close()
+        self.template.wait()
+
+
+def run_child(player_file, stdin, stdout):
+    """
+    Runs a player file in a forked child with the given stdin and stdout
+    """
+    os.dup2(stdin, 0)
+    os.dup2(stdout, 1)
+    os.close(stdin)
+    os.close(stdout)
+    sys.argv = [player_file]
+    sys.path[0] = os.path.dirname(player_file)
+    try:
+        runpy.run_path(player_file, run_name="__main__")
+        code = 0
+    except SystemExit as e:
+        code = e.code if isinstance(e.code, int) else int(e.code is not None)
+    except BaseException:
+        traceback.print_exc()
+        code = 1
+    sys.stdout.flush()
+    os._exit(code)
+
+
+def main():
+    """
+    Runs the template process
+    """
+    connection = socket.socket(fileno=int(sys.argv[1]))
+    for module in DEFAULT_MODULES + tuple(sys.argv[2:]):
+        importlib.import_module(module)
+
+    while True:
+        message, fds, flags, address = socket.recv_fds(connection, 4096, 2)
+        if not message:
+            break
+        command, argument = message.decode("utf-8").strip().split(" ", 1)
+        if command == "SPAWN":
+            reply = os.fork()
+            if reply == 0:
+                connection.close()
+                run_child(argument, *fds)
+            for fd in fds:
+                os.close(fd)
+        elif command == "WAIT":
+            try:
+                pid, status = os.waitpid(int(argument), 0)
+                reply = os.waitstatus_to_exitcode(status)
+            except ChildProcessError:
+                reply = ALREADY_REAPED
+        connection.sendall("{}\n".format(reply).encode("utf-8"))
@@ -54,6 +54,15 @@ class Team:
         """
         self.wood -= amount
 
+    def copy(self):
+        """
+        Returns a copy of our supplies, without any units
+        """
+        team = Team(self.id)
+        team.gold = self.gold
+        team.wood = self.wood
+        return team
+
     def get_units(self):
         """
         Returns the units a team has
@@ -1,13 +1,18 @@
 #!/usr/bin/env python3
-from warcode import constants
+from warcode import protocol
+from warcode.engine.entity_store import EntityView, field
+
+class Tree(EntityView):
+    """
+    A tree.  Its state is kept in the engine's entity store.
+    """
+    __slots__ = ()
+
+    wood = field("woods")
 
-class Tree:
     def __init__(self, id, x, y, engine):
-        self.id = id
-        self.x = x
-        self.y = y
-        self.engine = engine
-        self.wood = constants.TREE_HEALTH
+        self.store = engine.get_entity_store()
+        self.index = self.store.allocate_tree(id, x, y)
 
     def get_id(self):
         """
@@ -61,3 +66,8 @@ class Tree:
             "x": self.get_x(),
             "y": self.get_y()
         }
+
+    def pack_record(self):
+        store, index = self.store, self.index
+        return protocol.TREE_RECORD.pack(store.ids[index], store.xs[index],
+            store.ys[index], store.woods[index])
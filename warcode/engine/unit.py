@@ -1,5 +1,6 @@
 #!/usr/bin/env python3
-from warcode import constants
+from warcode import constants, exceptions, protocol
+from warcode.engine.entity_store import EntityView, field
 from warcode.exceptions import (
     IllegalAttackException,
     IllegalBuildException,
@@ -9,25 +10,39 @@ from warcode.exceptions import (
     IllegalMoveException
 )
 
-class Unit:
+class Unit(EntityView):
     """
-    A unit.
+    A unit.  Its state is kept in the engine's entity store.
     """
+    __slots__ = ()
+
+    health = field("healths")
+    gold = field("golds")
+    wood = field("woods")
+
     def __init__(self, id, x, y, unit_type, team, engine):
-        self.id = id
-        self.x = x
-        self.y = y
-        self.unit_type = unit_type
-        self.team = team
+        self.store = engine.get_entity_store()
+        self.index = self.store.allocate_unit(id, x, y, unit_type, team)
 
-        self.health = self.unit_type.get_initial_health()
-        self.gold = 0
-        self.wood = 0
+    @property
+    def unit_type(self):
+        return constants.UNIT_TYPES[self.store.unit_types[self.index]]
 
-        self.action_taken = True # Units can't take an action their first turn
+    @property
+    def team(self):
+        return self.store.teams[self.store.team_ids[self.index]]
 
-        self.engine = engine
-        self.game_map = self.engine.get_game_map()
+    @property
+    def action_taken(self):
+        return self.store.get_action_taken(self.index)
+
+    @action_taken.setter
+    def action_taken(self, boolean):
+        self.store.set_action_taken(self.index, boolean)
+
+    @property
+    def game_map(self):
+        return self.store.engine.get_game_map()
 
     def get_id(self):
         """
@@ -51,7 +66,7 @@ class Unit:
         """
         Returns a tuple (x, y) of our position.
         """
-        return (x, y)
+        return (self.x, self.y)
 
     def get_unit_type(self):
         """
@@ -111,10 +126,10 @@ class Unit:
         """
         Returns whether we have taken an action this turn
         """
-        return self.action_taken
+        return self.store.get_action_taken(self.index)
 
     def set_action_taken(self, boolean):
-        self.action_taken = boolean
+        self.store.set_action_taken(self.index, boolean)
 
     def reset(self):
         """
@@ -137,17 +152,23 @@ class Unit:
 
         # Throw  an error if we have already taken an action
         if self.get_action_taken():
-            raise IllegalAttackException("You can't take two actions in one turn.")
+            raise IllegalAttackException("You can't take two actions in one turn.",
+                exceptions.ACTION_TAKEN)
 
         # Throw error if we are trying to attack outside our range
         distance = self.distance_to(x, y)
         if (distance < self.unit_type.get_min_attack_distance() or
                 distance > self.unit_type.get_max_attack_distance()):
-            raise IllegalAttackException("You can't attack that far.")
+            raise IllegalAttackException("You can't attack that far.",
+                exceptions.OUT_OF_RANGE)
 
-        for thing in self.engine.get_all_things():
-            if thing.distance_to(location) <= self.unit_type.get_attack_splash():
-                thing.damage(self.unit_type.get_attack_damage)
+        hit = []
+        for dx, dy in self.unit_type.get_splash_stencil():
+            thing = self.engine.get_thing_at(x + dx, y + dy)
+            if thing is not None:
+                hit.append(thing)
+        for thing in hit:
+            thing.damage(self.unit_type.get_attack_damage())
 
         self.set_action_taken(True)
 
@@ -156,17 +177,25 @@ class Unit:
         Move the unit to a new location
         """
         if self.get_action_taken():
-            raise IllegalMoveException("You can't take two actions in one turn.")
+            raise IllegalMoveException("You can't take two actions in one turn.",
+                exceptions.ACTION_TAKEN)
 
         if self.distance_to(x, y) > self.unit_type.get_movement_speed():
-            raise IllegalMoveException("You can't move that fast.")
+            raise IllegalMoveException("You can't move that fast.",
+                exceptions.OUT_OF_RANGE)
+        if not self.game_map.in_bounds(x, y):
+            raise IllegalMoveException("You can't move off the map.",
+                exceptions.OFF_MAP)
         if self.game_map.get_square_at(x, y) != constants.EMPTY:
-            raise IllegalMoveException("You can only move onto an empty square.")
+            raise IllegalMoveException("You can only move onto an empty square.",
+                exceptions.SQUARE_TAKEN)
 
-        self.game_map.set_square_at(self.get_x(), self.get_y(), constants.EMPTY)
+        old_x, old_y = self.get_x(), self.get_y()
+        self.game_map.set_square_at(old_x, old_y, constants.EMPTY)
         self.game_map.set_square_at(x, y, self.get_id())
         self.x = x
         self.y = y
+        self.engine.move_unit(self, old_x, old_y)
 
         self.set_action_taken(True)
 
@@ -176,21 +205,30 @@ class Unit:
         it is an illegal move.  Returns the new id.
         """
         if self.get_action_taken():
-            raise IllegalBuildException("You can only take one action per turn.")
-        if self.team.get_gold() < self.unit_type.get_gold_cost():
-            raise IllegalBuildException("A {} costs too much gold for you to make.".format(unit_type))
-        if self.team.get_wood() < self.unit_type.get_wood_cost():
-            raise IllegalBuildException("A {} costs too much wood for you to make.".format(unit_type))
-        if self.distance_to(x, y) > 2:
-            raise IllegalBuildException("You can only build next to yourself")
+            raise IllegalBuildException("You can only take one action per turn.",
+                exceptions.ACTION_TAKEN)
+        if self.team.get_gold() < unit_type.get_gold_cost():
+            raise IllegalBuildException("A {} costs too much gold for you to make.".format(unit_type),
+                exceptions.NOT_ENOUGH_GOLD)
+        if self.team.get_wood() < unit_type.get_wood_cost():
+            raise IllegalBuildException("A {} costs too much wood for you to make.".format(unit_type),
+                exceptions.NOT_ENOUGH_WOOD)
+        if self.distance_to(x, y) > constants.NEIGHBOR_DISTANCE:
+            raise IllegalBuildException("You can only build next to yourself",
+                exceptions.OUT_OF_RANGE)
+        if not self.game_map.in_bounds(x, y):
+            raise IllegalBuildException("You can't build off the map.",
+                exceptions.OFF_MAP)
         if unit_type not in constants.ALLOWED_CREATIONS[self.unit_type]:
-            raise IllegalBuildException("You can't make a {}.".format(unit_type))
+            raise IllegalBuildException("You can't make a {}.".format(unit_type),
+                exceptions.CANT_MAKE)
         if self.game_map.get_square_at(x, y) != constants.EMPTY:
-            raise IllegalBuildException("You can only build on an empty square.")
+            raise IllegalBuildException("You can only build on an empty square.",
+                exceptions.SQUARE_TAKEN)
 
         self.team.subtract_gold(unit_type.get_gold_cost())
         self.team.subtract_wood(unit_type.get_wood_cost())
-        id = self.engine.create_unit(x, y, unit_type, self.team)
+        id = self.engine.create_unit(x, y, unit_type, self.team).get_id()
 
         self.set_action_taken(True)
         return id
@@ -200,13 +238,20 @@ class Unit:
         Mines gold from a location (if that location is a gold mine)
         """
         if self.get_action_taken():
-            raise IllegalMineException("You can only take one action per turn.")
-        if self.distance_to(x, y) > 2:
-            raise IllegalMineException("You can only mine next to yourself.")
+            raise IllegalMineException("You can only take one action per turn.",
+                exceptions.ACTION_TAKEN)
+        if self.distance_to(x, y) > constants.NEIGHBOR_DISTANCE:
+            raise IllegalMineException("You can only mine next to yourself.",
+                exceptions.OUT_OF_RANGE)
         if self.unit_type != constants.PEASANT:
-            raise IllegalMineException("Only peasants can mine gold.")
+            raise IllegalMineException("Only peasants can mine gold.",
+                exceptions.NOT_PEASANT)
+        if not self.game_map.in_bounds(x, y):
+            raise IllegalMineException("You can't mine off the map.",
+                exceptions.OFF_MAP)
         if self.game_map.get_square_at(x, y) != constants.GOLD_MINE:
-            raise Exception("You can only mine gold from gold mines.")
+            raise IllegalMineException("You can only mine gold from gold mines.",
+                exceptions.NOT_GOLD_MINE)
 
         self.add_gold(constants.MINE_AMOUNT)
         gold_mine = self.engine.get_gold_mine_at(x, y)
@@ -219,13 +264,20 @@ class Unit:
         Cuts wood from a location (if that location is a tree)
         """
         if self.get_action_taken():
-            raise IllegalCutException("You can only take one action per turn.")
-        if self.distance_to(x, y) > 2:
-            raise IllegalCutException("You can only cut wood next to yourself.")
+            raise IllegalCutException("You can only take one action per turn.",
+                exceptions.ACTION_TAKEN)
+        if self.distance_to(x, y) > constants.NEIGHBOR_DISTANCE:
+            raise IllegalCutException("You can only cut wood next to yourself.",
+                exceptions.OUT_OF_RANGE)
         if self.unit_type != constants.PEASANT:
-            raise IllegalCutException("Only peasants can cut wood.")
+            raise IllegalCutException("Only peasants can cut wood.",
+                exceptions.NOT_PEASANT)
+        if not self.game_map.in_bounds(x, y):
+            raise IllegalCutException("You can't cut wood off the map.",
+                exceptions.OFF_MAP)
         if self.game_map.get_square_at(x, y) != constants.TREE:
-            raise IllegalCutException("You can only cut wood from trees.")
+            raise IllegalCutException("You can only cut wood from trees.",
+                exceptions.NOT_TREE)
 
         self.add_wood(constants.CUT_AMOUNT)
         tree = self.engine.get_tree_at(x, y)
@@ -239,13 +291,17 @@ class Unit:
         fortress, add the amount to your team's gold/wood supply
         """
         if self.get_action_taken():
-            raise IllegalGiveException("You can only take one action per turn.")
-        if self.distance_to(x, y) > 2:
-            raise Exception("You can only give materials to a neighbor.")
+            raise IllegalGiveException("You can only take one action per turn.",
+                exceptions.ACTION_TAKEN)
+        if self.distance_to(other.get_x(), other.get_y()) > constants.NEIGHBOR_DISTANCE:
+            raise IllegalGiveException("You can only give materials to a neighbor.",
+                exceptions.OUT_OF_RANGE)
         if self.get_gold() < gold:
-            raise Exception("You can't give away gold you don't own. That's called stealing!")
+            raise IllegalGiveException("You can't give away gold you don't own. That's called stealing!",
+                exceptions.NOT_ENOUGH_GOLD)
         if self.get_wood() < wood:
-            raise Exception("You don't have enough wood to share.")
+            raise IllegalGiveException("You don't have enough wood to share.",
+                exceptions.NOT_ENOUGH_WOOD)
 
         self.subtract_gold(gold)
         self.subtract_wood(wood)
@@ -276,3 +332,16 @@ class Unit:
             "gold": self.get_gold(),
             "wood": self.get_wood()
         }
+
+    def pack_record(self):
+        store, index = self.store, self.index
+        return protocol.UNIT_RECORD.pack(
+            store.ids[index],
+            store.unit_types[index],
+            store.healths[index],
+            store.team_ids[index],
+            store.xs[index],
+            store.ys[index],
+            store.golds[index],
+            store.woods[index]
+        )
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+from warcode.engine import FogOfWar
+
+class Visibility:
+    """
+    What every team can see of the map.  Each square holds a bitmask of the
+    teams that can see it (bit team_id - 1), so a change to the map or to a
+    thing only has to touch the fogs of war of the teams whose bit is set,
+    however many teams are playing.
+    """
+    def __init__(self, engine):
+        self.engine = engine
+        game_map = engine.get_game_map()
+        self.masks = [
+            [0 for x in range(game_map.get_width())]
+            for y in range(game_map.get_height())
+        ]
+        self.fogs = {}
+        game_map.add_listener(self.update_square)
+
+    def copy(self, engine):
+        """
+        Returns a copy of what every team can see, for a copy of our engine
+        """
+        visibility = Visibility.__new__(Visibility)
+        visibility.engine = engine
+        visibility.masks = [list(row) for row in self.masks]
+        teams = engine.get_teams()
+        visibility.fogs = {
+            id: fog.copy(teams[id], visibility, engine.things)
+            for id, fog in self.fogs.items()
+        }
+        engine.get_game_map().add_listener(visibility.update_square)
+        return visibility
+
+    def add_team(self, team):
+        """
+        Starts tracking what a team can see, returning its fog of war
+        """
+        fog = FogOfWar(team, self)
+        self.fogs[team.get_id()] = fog
+        return fog
+
+    def get_fog_of_war(self, team):
+        """
+        Returns what a team can see of the map
+        """
+        return self.fogs[team.get_id()]
+
+    def get_mask(self, x, y):
+        """
+        Returns the bitmask of the teams that can see the square (x, y)
+        """
+        return self.masks[y][x]
+
+    def fogs_seeing(self, x, y):
+        """
+        Returns a generator of the fogs of war of the teams that can see the
+        square (x, y)
+        """
+        return self.fogs_in(self.masks[y][x])
+
+    def fogs_in(self, mask):
+        """
+        Returns a generator of the fogs of war of the teams in a bitmask
+        """
+        team_id = 1
+        while mask:
+            if mask & 1:
+                yield self.fogs[team_id]
+            mask >>= 1
+            team_id += 1
+
+    def update_square(self, x, y, value):
+        """
+        Copies a change to the map onto the boards of the teams that can see it
+        """
+        for fog in self.fogs_seeing(x, y):
+            fog.set_square(x, y, value)
+
+    def add_thing(self, thing):
+        """
+        Shows a unit, tree or gold mine that was put on the map to the teams
+        that can see it
+        """
+        for fog in self.fogs_seeing(thing.get_x(), thing.get_y()):
+            fog.visible_things[thing.get_id()] = thing
+
+    def remove_thing(self, thing):
+        """
+        Hides a unit, tree or gold mine that was taken off the map
+        """
+        for fog in self.fogs_seeing(thing.get_x(), thing.get_y()):
+            fog.visible_things.pop(thing.get_id(), None)
+
+    def move_thing(self, thing, old_x, old_y):
+        """
+        Updates which teams can see a thing that moved from (old_x, old_y)
+        """
+        old_mask = self.masks[old_y][old_x]
+        new_mask = self.masks[thing.get_y()][thing.get_x()]
+        for fog in self.fogs_in(old_mask & ~new_mask):
+            fog.visible_things.pop(thing.get_id(), None)
+        for fog in self.fogs_in(new_mask):
+            fog.visible_things[thing.get_id()] = thing
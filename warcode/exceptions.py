@@ -1,4 +1,31 @@
-class InvalidAction(Exception): pass
+# Codes for why an action was rejected, saved instead of the error's message
+MALFORMED = "MALFORMED"
+UNKNOWN_ACTION = "UNKNOWN_ACTION"
+UNKNOWN_UNIT = "UNKNOWN_UNIT"
+UNKNOWN_UNIT_TYPE = "UNKNOWN_UNIT_TYPE"
+NOT_YOUR_UNIT = "NOT_YOUR_UNIT"
+NEGATIVE_AMOUNT = "NEGATIVE_AMOUNT"
+ACTION_TAKEN = "ACTION_TAKEN"
+OUT_OF_RANGE = "OUT_OF_RANGE"
+OFF_MAP = "OFF_MAP"
+SQUARE_TAKEN = "SQUARE_TAKEN"
+NOT_ENOUGH_GOLD = "NOT_ENOUGH_GOLD"
+NOT_ENOUGH_WOOD = "NOT_ENOUGH_WOOD"
+CANT_MAKE = "CANT_MAKE"
+NOT_PEASANT = "NOT_PEASANT"
+NOT_GOLD_MINE = "NOT_GOLD_MINE"
+NOT_TREE = "NOT_TREE"
+
+
+class InvalidAction(Exception):
+    def __init__(self, message, code=MALFORMED):
+        super().__init__(message)
+        self.code = code
+
+    def get_code(self):
+        return self.code
+
+
 class IllegalAttackException(InvalidAction): pass
 class IllegalBuildException(InvalidAction): pass
 class IllegalCutException(InvalidAction): pass
@@ -0,0 +1,227 @@
+#!/usr/bin/env python3
+"""
+The binary protocol between the engine and players.
+
+Every message is framed by a header holding its kind and the length of its
+payload.  An observation payload is a fixed header, then the board as one byte
+per square, then fixed width records for the units, gold mines and trees.
+Squares holding a unit are marked UNIT_SQUARE on the board; the unit's id is
+found from its record.  The board may only cover part of the map, so the
+header also holds the position of its top left square.
+
+With the shared memory protocol, the observation is written after a
+SEGMENT_HEADER holding the turn it is for.  The turn is set to 0 while the
+observation is being written, so a player that is behind can tell its turn's
+observation has been written over.
+
+The engine reads players' messages, framed or one per line, with a
+MessageReader, which never keeps more than a set number of bytes of a message.
+"""
+import struct
+
+from warcode import constants
+
+# Kinds of messages
+OBSERVATION = 1
+ACTIONS = 2
+END = 3
+
+HEADER = struct.Struct(">BI")
+OBSERVATION_HEADER = struct.Struct(">diiHHHHIII")
+SEGMENT_HEADER = struct.Struct(">Q")
+UNIT_RECORD = struct.Struct(">IBiBHHii")
+GOLD_MINE_RECORD = struct.Struct(">IHHi")
+TREE_RECORD = struct.Struct(">IHHi")
+
+UNIT_SQUARE = "U"
+
+
+def frame(kind, payload):
+    """
+    Returns a message of a kind with its header
+    """
+    return HEADER.pack(kind, len(payload)) + payload
+
+
+def read_exactly(stream, size):
+    """
+    Reads size bytes from a binary stream, raising EOFError if it ends first
+    """
+    data = stream.read(size)
+    if len(data) < size:
+        raise EOFError("The stream ended in the middle of a message.")
+    return data
+
+
+def read_frame(stream):
+    """
+    Reads a message from a binary stream, returning its kind and payload
+    """
+    kind, size = HEADER.unpack(read_exactly(stream, HEADER.size))
+    return kind, read_exactly(stream, size)
+
+
+class MessageReader:
+    """
+    Reads messages from an asyncio stream in chunks, either lines or framed
+    messages.  A line longer than max_size bytes is cut short, keeping its
+    first max_size bytes and skipping the rest, and a framed message that
+    long isn't read at all.  A line that is being read is kept between calls,
+    so reading one can be cancelled and picked up again.
+    """
+    # Bytes asked of the stream at a time
+    CHUNK_SIZE = 65536
+
+    def __init__(self, stream, max_size):
+        self.stream = stream
+        self.max_size = max_size
+        self.buffer = bytearray()
+        # The start of the line being read, and whether some of it was skipped
+        self.line = bytearray()
+        self.truncated = False
+
+    async def fill(self):
+        """
+        Adds the next chunk of the stream to our buffer, returning False if
+        the stream has ended
+        """
+        data = await self.stream.read(self.CHUNK_SIZE)
+        self.buffer += data
+        return len(data) > 0
+
+    async def read_line(self):
+        """
+        Returns the next line, without its newline, and whether it was cut
+        short, or None if the stream ends first
+        """
+        while True:
+            end = self.buffer.find(b"\n")
+            part = self.buffer if end < 0 else self.buffer[:end]
+            room = self.max_size - len(self.line)
+            if len(part) > room:
+                self.truncated = True
+            self.line += part[:room]
+            if end < 0:
+                self.buffer.clear()
+                if not await self.fill():
+                    return None
+                continue
+            del self.buffer[:end + 1]
+            line, truncated = bytes(self.line), self.truncated
+            self.line.clear()
+            self.truncated = False
+            return line, truncated
+
+    async def read_exactly(self, size):
+        """
+        Returns the next size bytes, or None if the stream ends first
+        """
+        while len(self.buffer) < size:
+            if not await self.fill():
+                return None
+        data = bytes(self.buffer[:size])
+        del self.buffer[:size]
+        return data
+
+    async def read_frame(self):
+        """
+        Returns the next framed message's kind and its payload, or None if the
+        stream ends first.  A payload longer than max_size bytes isn't read,
+        and None is returned in its place.
+        """
+        header = await self.read_exactly(HEADER.size)
+        if header is None:
+            return None
+        kind, size = HEADER.unpack(header)
+        if size > self.max_size:
+            return kind, None
+        payload = await self.read_exactly(size)
+        if payload is None:
+            return None
+        return kind, payload
+
+
+def encode_row(row):
+    """
+    Encodes a row of the board as one byte per square
+    """
+    return "".join(
+        square if square.__class__ is str else UNIT_SQUARE for square in row
+    ).encode("ascii")
+
+
+def encode_observation(time, gold, wood, rows, units, gold_mines, trees,
+        origin=(0, 0)):
+    """
+    Encodes an observation from the encoded rows of the board, starting at
+    origin, and lists of unit, gold mine and tree records
+    """
+    width = len(rows[0]) if rows else 0
+    return b"".join([
+        OBSERVATION_HEADER.pack(time, gold, wood, origin[0], origin[1], width,
+            len(rows), len(units), len(gold_mines), len(trees)),
+        b"".join(rows),
+        b"".join(units),
+        b"".join(gold_mines),
+        b"".join(trees)
+    ])
+
+
+def decode_observation(buffer, fields=constants.OBSERVATION_FIELDS):
+    """
+    Decodes an observation into the same dictionary a json observation has.
+    The buffer may be bytes or a memoryview.  There is no map if the
+    observation has no board, and "units", "gold_mines" and "trees" are left
+    out unless they are in fields, as they would be from the engine.
+    """
+    (time, gold, wood, left, top, width, height, num_units, num_gold_mines,
+        num_trees) = OBSERVATION_HEADER.unpack_from(buffer, 0)
+    offset = OBSERVATION_HEADER.size
+
+    squares = str(buffer[offset:offset + width * height], "ascii")
+    board = [list(squares[y * width:(y + 1) * width]) for y in range(height)]
+    offset += width * height
+
+    units = []
+    for i in range(num_units):
+        id, type, health, team, x, y, unit_gold, unit_wood = (
+            UNIT_RECORD.unpack_from(buffer, offset))
+        offset += UNIT_RECORD.size
+        units.append({
+            "id": id,
+            "type": constants.UNIT_TYPES[type].get_name(),
+            "health": health,
+            "team": team,
+            "x": x,
+            "y": y,
+            "gold": unit_gold,
+            "wood": unit_wood
+        })
+        if board:
+            board[y - top][x - left] = id
+
+    gold_mines = []
+    for i in range(num_gold_mines):
+        id, x, y, mine_gold = GOLD_MINE_RECORD.unpack_from(buffer, offset)
+        offset += GOLD_MINE_RECORD.size
+        gold_mines.append({"id": id, "gold": mine_gold, "x": x, "y": y})
+
+    trees = []
+    for i in range(num_trees):
+        id, x, y, tree_wood = TREE_RECORD.unpack_from(buffer, offset)
+        offset += TREE_RECORD.size
+        trees.append({"id": id, "wood": tree_wood, "x": x, "y": y})
+
+    observation = {"time": time}
+    if "units" in fields:
+        observation["units"] = units
+    if "gold_mines" in fields:
+        observation["gold_mines"] = gold_mines
+    if "trees" in fields:
+        observation["trees"] = trees
+    observation["gold"] = gold
+    observation["wood"] = wood
+    if board:
+        observation["map"] = board
+        observation["origin"] = [left, top]
+    return observation
@@ -7,6 +7,9 @@ class GoldMine:
         self.x = x
         self.y = y
 
+    def get_id(self):
+        return self.id
+
     def get_x(self):
         return self.x
 
@@ -2,14 +2,17 @@
 from warcode import constants
 
 class Map:
-    def __init__(self, map_data):
+    def __init__(self, map_data, origin=(0, 0)):
         """
         Creates a map from given map data, units, gold mines, and trees.  The
         units, gold mines, and trees should be dictionaries of id: value pairs.
+        If only part of the map was sent, origin is the position of its top
+        left square.
         """
-        self.width = len(map_data[0])
-        self.height = len(map_data[1])
+        self.width = len(map_data[0]) if map_data else 0
+        self.height = len(map_data)
         self.board = map_data
+        self.origin_x, self.origin_y = origin
 
     def get_width(self):
         return self.width
@@ -17,5 +20,18 @@ class Map:
     def get_height(self):
         return self.height
 
+    def get_origin(self):
+        return (self.origin_x, self.origin_y)
+
+    def in_bounds(self, x, y):
+        """
+        Returns whether (x, y) is a square on the map
+        """
+        return (0 <= x - self.origin_x < self.width
+            and 0 <= y - self.origin_y < self.height)
+
+    def get_square(self, x, y):
+        return self.board[y - self.origin_y][x - self.origin_x]
+
     def set_square(self, x, y, value):
-        self.board[y][x] = value
+        self.board[y - self.origin_y][x - self.origin_x] = value
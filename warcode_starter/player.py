@@ -1,11 +1,28 @@
 #!/usr/bin/env python3
 import json
+import sys
 import traceback
+from multiprocessing import resource_tracker, shared_memory
 
-from warcode import constants
+from warcode import constants, protocol
 from warcode_starter import Map, Unit, GoldMine, Tree
 
 class Player:
+    # Set this to constants.DELTA_PROTOCOL in your player to only be sent what
+    # changed each turn, or to BINARY_PROTOCOL or SHARED_MEMORY_PROTOCOL for
+    # faster encodings.  The starter kit keeps track of the rest.
+    protocol = constants.FULL_PROTOCOL
+    # Leave out any of constants.OBSERVATION_FIELDS you don't need to be sent
+    # them.  Without "map", self.map is None each turn.
+    fields = constants.OBSERVATION_FIELDS
+    # Set this to (x, y, width, height) to only be sent that part of the map
+    # and the things in it.
+    region = None
+    # Set by the engine when it runs players in its own process.  Instead of
+    # reading turns from stdin, a new player is handed to this function and
+    # the engine calls _start and _play itself.
+    _in_process = None
+
     def __init__(self, name="Default"):
         """
         Construction of a player.  Pass your name in the super construct.
@@ -15,15 +32,24 @@ class Player:
         self.gold = 0
         self.wood = 0
         self.actions = []
+        self._shared_memory = None
 
-        self._first_turn()
+        if Player._in_process is not None:
+            Player._in_process(self)
+            return
+        # Play games until the engine stops sending them
         while True:
-            self._turn()
+            self._first_turn()
+            while self._turn():
+                pass
+            if not self._reset():
+                break
 
 
     def first_turn(self):
         """
-        You implement this function in your own code!
+        You implement this function in your own code!  If the engine reuses
+        your process, this is called again at the start of each new game.
         """
         pass
 
@@ -37,8 +63,13 @@ class Player:
         """
         Prepare self for the first turn and then run the first turn
         """
+        self.output(self._start(json.loads(self.input())))
+
+    def _start(self, input_data):
+        """
+        Runs the first turn from its input, returning our reply to it
+        """
         self.turn_number += 1
-        input_data = json.loads(self.input())
         self.teams = input_data["teams"]
         self.team = input_data["team_id"]
         self.num_players = input_data["num_players"]
@@ -48,33 +79,131 @@ class Player:
             self.units[unit.id] = unit
         self.map = Map(input_data["map"])
 
+        if self.protocol not in input_data.get("protocols", []):
+            self.protocol = constants.FULL_PROTOCOL
+        if self.protocol == constants.DELTA_PROTOCOL:
+            # What we know of the game, updated with the changes sent to us
+            self._board = [
+                [constants.INVISIBLE for x in range(self.map.get_width())]
+                for y in range(self.map.get_height())
+            ]
+            self._unit_data = {}
+            self._gold_mine_data = {}
+            self._tree_data = {}
+
         try:
             self.first_turn()
         except Exception:
-            self.log(traceback.extract_stack())
+            self.log(traceback.format_exc())
 
-        self.output(self.name)
+        options = {"name": self.name, "protocol": self.protocol}
+        if tuple(self.fields) != constants.OBSERVATION_FIELDS:
+            options["fields"] = list(self.fields)
+        if self.region is not None:
+            options["region"] = list(self.region)
+        if len(options) == 2 and self.protocol == constants.FULL_PROTOCOL:
+            return self.name
+        return json.dumps(options)
 
     def _turn(self):
         """
-        Prepare self for a turn and then run the turn
+        Prepare self for a turn and then run the turn.  Returns False instead
+        if the game is over.
         """
-        self.turn_number += 1
+        if self.protocol == constants.BINARY_PROTOCOL:
+            payload = self.input_binary()
+            if payload is None:
+                return False
+            input_data = protocol.decode_observation(payload, self.fields)
+        else:
+            line = self.input()
+            # Anything other than json is the message saying who won
+            if not line.startswith("{"):
+                return False
+            if self.protocol == constants.SHARED_MEMORY_PROTOCOL:
+                input_data = self.input_shared_memory(json.loads(line))
+                if input_data is None:
+                    # We fell behind and the engine has moved on, so answer
+                    # the old turn without playing it.
+                    self.output("[]")
+                    return True
+            else:
+                input_data = json.loads(line)
+
+        actions = self._play(input_data)
+
+        if self.protocol == constants.BINARY_PROTOCOL:
+            self.output_binary(json.dumps(actions).encode('utf-8'))
+        else:
+            self.output(json.dumps(actions))
+        return True
+
+    def _reset(self):
+        """
+        Waits for the engine to start another game with us, returning whether
+        it did
+        """
+        try:
+            line = self.input()
+        except EOFError:
+            return False
+        if line.strip() != "RESET":
+            return False
+        if self._shared_memory is not None:
+            self._shared_memory.close()
+            self._shared_memory = None
+        self.turn_number = 0
+        self.gold = 0
+        self.wood = 0
+        self.actions = []
+        self.protocol = type(self).protocol
+        self.output("RESET")
+        return True
 
-        input_data = json.loads(self.input())
+    def _play(self, input_data):
+        """
+        Runs a turn from its input, returning our actions
+        """
+        self.turn_number += 1
         self.time = input_data["time"]
+        if self.protocol == constants.DELTA_PROTOCOL:
+            self._apply_delta(input_data)
+            unit_data = self._unit_data.values()
+            gold_mine_data = self._gold_mine_data.values()
+            tree_data = self._tree_data.values()
+            # Copy the board, since our actions change the map we hand out,
+            # cutting it down to our region like the other protocols' boards
+            board = None
+            if "map" in self.fields:
+                board = [list(row) for row in self._board]
+                if "origin" in input_data:
+                    left, top = input_data["origin"]
+                    x, y, width, height = self.region
+                    board = [
+                        row[left:max(x + width, left)]
+                        for row in board[top:max(y + height, top)]
+                    ]
+        else:
+            unit_data = input_data.get("units", [])
+            gold_mine_data = input_data.get("gold_mines", [])
+            tree_data = input_data.get("trees", [])
+            board = input_data.get("map")
+
         self.units = {}
-        for data in input_data["units"]:
+        for data in unit_data:
             unit = Unit(self, **data)
             self.units[unit.id] = unit
-        gold_mines = {}
-        for data in input_data["gold_mines"]:
+        self.gold_mines = {}
+        for data in gold_mine_data:
             gold_mine = GoldMine(self, **data)
-        trees = {}
-        for data in input_data["trees"]:
-            tree = GoldMine(self, **data)
-            trees[tree.id] = tree
-        self.map = Map(input_data["map"])
+            self.gold_mines[gold_mine.id] = gold_mine
+        self.trees = {}
+        for data in tree_data:
+            tree = Tree(self, **data)
+            self.trees[tree.id] = tree
+        self.map = None
+        if board is not None:
+            self.map = Map(board, input_data.get("origin", (0, 0)))
         self.gold = input_data["gold"]
         self.wood = input_data["wood"]
 
@@ -83,9 +212,26 @@ class Player:
         try:
             self.turn()
         except Exception:
-            self.log(traceback.extract_stack())
+            self.log(traceback.format_exc())
+
+        return self.actions
 
-        self.output(json.dumps(self.actions))
+    def _apply_delta(self, input_data):
+        """
+        Update what we know of the game with the changes sent for a turn
+        """
+        for x, y, value in input_data.get("squares", []):
+            self._board[y][x] = value
+        for id in input_data["removed"]:
+            self._unit_data.pop(id, None)
+            self._gold_mine_data.pop(id, None)
+            self._tree_data.pop(id, None)
+        for data in input_data.get("units", []):
+            self._unit_data[data["id"]] = data
+        for data in input_data.get("gold_mines", []):
+            self._gold_mine_data[data["id"]] = data
+        for data in input_data.get("trees", []):
+            self._tree_data[data["id"]] = data
 
     def get_turn_number(self):
         return self.turn_number
@@ -94,14 +240,21 @@ class Player:
         """
         Adds a unit to our units
         """
-        self.map.set_square(unit.get_x(), unit.get_y(), unit.get_id())
+        self._set_square(unit.get_x(), unit.get_y(), unit.get_id())
         self.units[unit.get_id()] = unit
 
+    def _set_square(self, x, y, value):
+        """
+        Sets a square of our map, if we have one and the square is on it
+        """
+        if self.map is not None and self.map.in_bounds(x, y):
+            self.map.set_square(x, y, value)
+
     def remove_unit(self, unit):
         """
         Removes a unit from our units
         """
-        self.map.set_square(unit.get_x(), unit.get_y(), constants.EMPTY)
+        self._set_square(unit.get_x(), unit.get_y(), constants.EMPTY)
         del self.units[unit.get_id()]
 
     def get_unit_at(self, x, y):
@@ -109,15 +262,40 @@ class Player:
         Returns the unit at the position (x, y) and None if there is no unit at
         the position
         """
-        for unit in self.units.items():
-            if unit.get_position() == (x, y):
-                return unit
+        if self.map is None:
+            for unit in self.units.values():
+                if unit.get_position() == (x, y):
+                    return unit
+            return None
+        if not self.map.in_bounds(x, y):
+            return None
+        square = self.map.get_square(x, y)
+        if isinstance(square, int):
+            return self.units.get(square)
+        return None
+
+    def get_thing_at(self, x, y):
+        """
+        Returns the unit, tree or gold mine at the position (x, y) and None if
+        there is nothing we know of there
+        """
+        if self.map is None:
+            return (self.get_unit_at(x, y) or self.get_tree_at(x, y)
+                or self.get_gold_mine_at(x, y))
+        if not self.map.in_bounds(x, y):
+            return None
+        square = self.map.get_square(x, y)
+        if square == constants.TREE:
+            return self.get_tree_at(x, y)
+        elif square == constants.GOLD_MINE:
+            return self.get_gold_mine_at(x, y)
+        return self.get_unit_at(x, y)
 
     def remove_tree(self, tree):
         """
         Removes a tree from our trees
         """
-        self.map.set_square(tree.get_x(), tree.get_y(), constants.EMPTY)
+        self._set_square(tree.get_x(), tree.get_y(), constants.EMPTY)
         del self.trees[tree.get_id()]
 
     def get_tree_at(self, x, y):
@@ -125,15 +303,15 @@ class Player:
         Returns the tree at the position (x, y) and None if there is no tree
         at the position
         """
-        for tree in self.trees.items():
-            if tree.get_position() == (x, y):
+        for tree in self.trees.values():
+            if tree.get_location() == (x, y):
                 return tree
 
-    def remove_mine(self, gold_mine):
+    def remove_gold_mine(self, gold_mine):
         """
         Removes a gold mine from our mines
         """
-        self.map.set_square(gold_mine.get_x(), gold_mine.get_y(), constants.BLOCK)
+        self._set_square(gold_mine.get_x(), gold_mine.get_y(), constants.BLOCK)
         del self.gold_mines[gold_mine.get_id()]
 
     def get_gold_mine_at(self, x, y):
@@ -141,6 +319,9 @@ class Player:
         Returns the gold mine at the position (x, y) and None if there is no
         gold mine at the position
         """
+        for gold_mine in self.gold_mines.values():
+            if gold_mine.get_location() == (x, y):
+                return gold_mine
 
     def move(self, unit, x, y):
         """
@@ -148,12 +329,12 @@ class Player:
         change
         """
 
-        self.map.set_square(unit.get_x(), unit.get_y(), constants.EMPTY)
-        self.map.set_square(x, y, unit.get_id())
+        self._set_square(unit.get_x(), unit.get_y(), constants.EMPTY)
+        self._set_square(x, y, unit.get_id())
         unit.set_position(x, y)
 
         self.actions.append({
-            "type": "move",
+            "type": constants.MOVE,
             "unit": unit.get_id(),
             "x": x,
             "y": y
@@ -165,9 +346,14 @@ class Player:
         change
         """
 
-        for other in list(self.units) + list(self.trees) + list(self.gold_mines):
-            if other.distance_to(x, y) <= unit.get_unit_type().get_attack_splash():
-                other.damage(unit.get_unit_type().get_attack_damage())
+        unit_type = unit.get_unit_type()
+        hit = []
+        for dx, dy in unit_type.get_splash_stencil():
+            other = self.get_thing_at(x + dx, y + dy)
+            if other is not None:
+                hit.append(other)
+        for other in hit:
+            other.damage(unit_type.get_attack_damage())
 
         self.actions.append({
             "type": constants.ATTACK,
@@ -184,7 +370,8 @@ class Player:
 
         # Note that the id generated is negative.  This is because the unit
         # cannot do any actions on its first turn.
-        new_unit = Unit(unit_type, x, y, -len(self.units))
+        new_unit = Unit(self, -len(self.units) - 1, x, y, str(unit_type),
+            self.team)
         self.gold -= unit_type.get_gold_cost()
         self.wood -= unit_type.get_wood_cost()
         self.add_unit(new_unit)
@@ -192,7 +379,7 @@ class Player:
         self.actions.append({
             "type": constants.BUILD,
             "unit": unit.get_id(),
-            "unit_type": unit_type,
+            "unit_type": str(unit_type),
             "x": x,
             "y": y
         })
@@ -213,7 +400,7 @@ class Player:
             other.add_wood(wood)
 
         self.actions.append({
-            "type": constants.BUILD,
+            "type": constants.GIVE,
             "unit": unit.get_id(),
             "other": other.get_id(),
             "gold": gold,
@@ -245,10 +432,6 @@ class Player:
         gold_mine.subtract_gold(constants.MINE_AMOUNT)
         unit.add_gold(constants.MINE_AMOUNT)
 
-        if gold_mine.get_gold() <= 0:
-            map.set_square(x, y, constants.BLOCK)
-            self.gold_mines.remove(gold_mine)
-
         self.actions.append({
             "type": constants.MINE,
             "unit": unit.get_id(),
@@ -258,11 +441,12 @@ class Player:
 
     def log(self, message):
         """
-        Log a message to the warcode engine
+        Log a message to the warcode engine.  Anything that isn't a string is
+        logged as str(message).
         """
         self.actions.append({
             "type": constants.LOG,
-            "message": message
+            "message": str(message)
         })
 
     def output(self, string):
@@ -276,3 +460,58 @@ class Player:
         Reads data from stdin, where the warcode engine gives us data
         """
         return input()
+
+    def output_binary(self, payload):
+        """
+        Outputs a binary protocol message with our actions to stdout
+        """
+        sys.stdout.buffer.write(protocol.frame(protocol.ACTIONS, payload))
+        sys.stdout.buffer.flush()
+
+    def input_binary(self):
+        """
+        Reads a binary protocol message from stdin, returning the payload of
+        an observation, or None when the game is over
+        """
+        kind, payload = protocol.read_frame(sys.stdin.buffer)
+        if kind == protocol.END:
+            return None
+        return payload
+
+    def input_shared_memory(self, header):
+        """
+        Decodes the observation the engine left in shared memory, given the
+        header it sent for the turn.  Returns None if the engine has already
+        written a later turn's observation over it.
+        """
+        if self._shared_memory is None or self._shared_memory.name != header["name"]:
+            if self._shared_memory is not None:
+                self._shared_memory.close()
+                self._shared_memory = None
+            try:
+                self._shared_memory = shared_memory.SharedMemory(name=header["name"])
+            except FileNotFoundError:
+                # The engine has moved on to a bigger segment
+                return None
+            # The engine owns the segment, so don't let our resource tracker
+            # unlink it when we exit.
+            resource_tracker.unregister(self._shared_memory._name, "shared_memory")
+        buffer = self._shared_memory.buf
+        start = protocol.SEGMENT_HEADER.size
+        if protocol.SEGMENT_HEADER.unpack_from(buffer)[0] != header["turn"]:
+            return None
+        # Decode straight out of the segment, and check it wasn't written over
+        # while we did
+        payload = buffer[start:start + header["size"]]
+        try:
+            observation = protocol.decode_observation(payload, self.fields)
+        except Exception:
+            # Being written over can leave anything in the segment
+            if protocol.SEGMENT_HEADER.unpack_from(buffer)[0] != header["turn"]:
+                return None
+            raise
+        finally:
+            payload.release()
+        if protocol.SEGMENT_HEADER.unpack_from(buffer)[0] != header["turn"]:
+            return None
+        return observation
@@ -16,6 +16,9 @@ class Unit:
     def get_id(self):
         return self.id
 
+    def get_unit_type(self):
+        return self.unit_type
+
     def get_health(self):
         return self.health
 